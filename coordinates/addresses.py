@@ -0,0 +1,33 @@
+import re
+
+
+ADDRESS_ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+# Words that do not change the place, "г. Москва, д. 1" is "Москва, 1".
+OMITTED_WORDS = {'г', 'гор', 'город', 'д', 'дом'}
+
+
+def normalize_address(address):
+    words = re.findall(r'\w+(?:-\w+)*', address.lower().replace('ё', 'е'))
+    return ' '.join(
+        ADDRESS_ABBREVIATIONS.get(word, word)
+        for word in words
+        if word not in OMITTED_WORDS
+    )
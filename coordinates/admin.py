@@ -1,9 +1,17 @@
 from django.contrib import admin
 
-from .models import PlaceCoordinates
+from .models import GeocodingJob, PlaceCoordinates
 
 
 @admin.register(PlaceCoordinates)
 class PlaceCoordinatesAdmin(admin.ModelAdmin):
     list_display = ('address', 'save_date', 'lat', 'lon')
-    readonly_fields = ['save_date', 'lat', 'lon']
+    search_fields = ['address', 'normalized_address']
+    readonly_fields = ['normalized_address', 'save_date', 'lat', 'lon']
+
+
+@admin.register(GeocodingJob)
+class GeocodingJobAdmin(admin.ModelAdmin):
+    list_display = ('address', 'status', 'attempts', 'created_at', 'last_attempt_at')
+    list_filter = ('status',)
+    readonly_fields = ['attempts', 'last_error', 'created_at', 'last_attempt_at', 'locked_until']
@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+
+class TwoTierCache:
+    # A bounded per-process LRU in front of Django's cache. Local entries
+    # and the cache version live at most local_timeout seconds, so a change
+    # or a clear() made by another worker is seen after that time.
+
+    def __init__(self, prefix, max_size=10000, local_timeout=60, timeout=24 * 60 * 60):
+        self.prefix = prefix
+        self.max_size = max_size
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._local = OrderedDict()
+        self._version = None
+        self._version_expires_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _version_key(self):
+        return f'{self.prefix}:version'
+
+    def _get_version(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and self._version_expires_at > now:
+                return self._version
+        cache.add(self._version_key, 1, timeout=None)
+        version = cache.get(self._version_key, 1)
+        with self._lock:
+            self._version = version
+            self._version_expires_at = now + self.local_timeout
+        return version
+
+    def _make_key(self, key, version):
+        key_hash = hashlib.md5(str(key).encode()).hexdigest()
+        return f'{self.prefix}:{version}:{key_hash}'
+
+    def get_many(self, keys):
+        version = self._get_version()
+        cache_keys = {self._make_key(key, version): key for key in set(keys)}
+        found = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for cache_key, key in cache_keys.items():
+                local_entry = self._local.get(cache_key)
+                if local_entry is None:
+                    continue
+                value, expires_at = local_entry
+                if expires_at < now:
+                    del self._local[cache_key]
+                    continue
+                self._local.move_to_end(cache_key)
+                found[key] = value
+            self.local_hits += len(found)
+
+        missing_cache_keys = [
+            cache_key for cache_key, key in cache_keys.items() if key not in found
+        ]
+        shared_found = cache.get_many(missing_cache_keys) if missing_cache_keys else {}
+        self._set_local(shared_found)
+        for cache_key, value in shared_found.items():
+            found[cache_keys[cache_key]] = value
+
+        with self._lock:
+            self.shared_hits += len(shared_found)
+            self.misses += len(missing_cache_keys) - len(shared_found)
+        return found
+
+    def _set_local(self, values):
+        expires_at = time.monotonic() + self.local_timeout
+        with self._lock:
+            for cache_key, value in values.items():
+                self._local[cache_key] = (value, expires_at)
+                self._local.move_to_end(cache_key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def set_many(self, values):
+        if not values:
+            return
+        version = self._get_version()
+        cache_values = {
+            self._make_key(key, version): value for key, value in values.items()
+        }
+        cache.set_many(cache_values, timeout=self.timeout)
+        self._set_local(cache_values)
+
+    def delete_many(self, keys):
+        version = self._get_version()
+        cache_keys = [self._make_key(key, version) for key in set(keys)]
+        cache.delete_many(cache_keys)
+        with self._lock:
+            for cache_key in cache_keys:
+                self._local.pop(cache_key, None)
+
+    def clear(self):
+        try:
+            cache.incr(self._version_key)
+        except ValueError:
+            cache.set(self._version_key, 2, timeout=None)
+        with self._lock:
+            self._local.clear()
+            self._version = None
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'local_size': len(self._local),
+            }
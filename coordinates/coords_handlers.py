@@ -1,50 +1,249 @@
-import requests
+from functools import lru_cache
+from typing import NamedTuple
+
 from django.conf import settings
-from geopy import distance
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from coordinates.addresses import normalize_address
+from coordinates.cache import TwoTierCache
+from coordinates.models import GeocodingJob, PlaceCoordinates
+from coordinates.signals import places_geocoded
+from star_burger.metrics import registry
+
+
+# Keeps the IN (...) list below the SQLite bound parameters limit.
+COORDINATES_CHUNK_SIZE = 500
+
+
+class Coordinates(NamedTuple):
+    lat: float
+    lon: float
+
+
+class GeocodingResult(NamedTuple):
+    geocoded: int
+    postponed: int
+
+
+coordinates_cache = TwoTierCache(
+    'coordinates',
+    max_size=settings.COORDINATES_LOCAL_CACHE_SIZE,
+    local_timeout=settings.COORDINATES_LOCAL_CACHE_TIMEOUT,
+    timeout=settings.COORDINATES_CACHE_TIMEOUT,
+)
+distances_cache = TwoTierCache(
+    'distances',
+    max_size=settings.COORDINATES_LOCAL_CACHE_SIZE,
+    local_timeout=settings.COORDINATES_LOCAL_CACHE_TIMEOUT,
+    timeout=settings.COORDINATES_CACHE_TIMEOUT,
+)
 
-from coordinates.models import PlaceCoordinates
+
+def collect_caches_stats():
+    for cache_name, two_tier_cache in [
+        ('coordinates', coordinates_cache),
+        ('distances', distances_cache),
+    ]:
+        cache_stats = two_tier_cache.get_stats()
+        for result in ['local_hits', 'shared_hits', 'misses']:
+            yield (
+                'starburger_cache_requests_total',
+                'Обращения к кэшу координат и расстояний',
+                {'cache': cache_name, 'result': result},
+                cache_stats[result],
+            )
+
+
+registry.add_collector(collect_caches_stats)
+
+
+@lru_cache(maxsize=None)
+def get_geocoder():
+    geocoder_class = import_string(settings.GEOCODER)
+    return geocoder_class.from_settings()
 
 
 def fetch_coordinates(address):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": settings.YANDEX_API_KEY,
-        "format": "json",
-    })
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+    return get_geocoder().observed_geocode(address)
 
-    if not found_places:
-        return None
 
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lat, lon
+def store_coordinates(address, place_coordinates):
+    place = (
+        PlaceCoordinates.objects
+        .filter(normalized_address=normalize_address(address))
+        .first()
+    ) or PlaceCoordinates(address=address)
+    place.lat, place.lon = place_coordinates or (None, None)
+    place.save()
+    coordinates_cache.delete_many([place.normalized_address])
 
 
 def save_coordinates(address):
-    new_address, created = PlaceCoordinates.objects.get_or_create(
-        address=address,
+    is_fresh = (
+        PlaceCoordinates.objects
+        .fresh()
+        .filter(normalized_address=normalize_address(address))
+        .exists()
+    )
+    if not is_fresh:
+        store_coordinates(address, fetch_coordinates(address))
+
+
+def enqueue_geocoding_many(addresses):
+    normalized_addresses = {
+        normalize_address(address): address for address in addresses
+    }
+    fresh_addresses = set(
+        PlaceCoordinates.objects
+        .fresh()
+        .filter(normalized_address__in=normalized_addresses)
+        .values_list('normalized_address', flat=True)
+    )
+    addresses_to_enqueue = [
+        address
+        for normalized_address, address in normalized_addresses.items()
+        if normalized_address not in fresh_addresses
+    ]
+    GeocodingJob.objects.bulk_create(
+        [GeocodingJob(address=address) for address in addresses_to_enqueue],
+        ignore_conflicts=True,
     )
-    if created:
-        place_coordinates = fetch_coordinates(address)
-        if place_coordinates:
-            new_address.lat, new_address.lon = place_coordinates
-            new_address.save()
-
-
-def count_distance(from_place, to_place, places_coords):
-    coord_to_count = []
-    for place in [from_place, to_place]:
-        if places_coords[place]:
-            coord_to_count.append(places_coords[place])
-        else:
-            place_instance = PlaceCoordinates.objects.filter(
-                address=place).first()
-            if not place_instance or not place_instance.lat:
-                return 'не удалось вычислить расстояние, нет координат места'
-            coord_to_count.append((place_instance.lat, place_instance.lon))
-            places_coords[place] = (place_instance.lat, place_instance.lon)
-
-    return round((distance.distance(coord_to_count[0], coord_to_count[1]).km), 2)
+    GeocodingJob.objects.filter(
+        address__in=addresses_to_enqueue,
+        status=GeocodingJob.FAILED,
+    ).update(status=GeocodingJob.PENDING, attempts=0)
+
+
+def enqueue_stale_places(limit):
+    stale_addresses = list(
+        PlaceCoordinates.objects
+        .stale()
+        .exclude(address__in=GeocodingJob.objects.values('address'))
+        .order_by('save_date')
+        .values_list('address', flat=True)[:limit]
+    )
+    GeocodingJob.objects.bulk_create(
+        [GeocodingJob(address=address) for address in stale_addresses],
+        ignore_conflicts=True,
+    )
+    return len(stale_addresses)
+
+
+def retry_failed_geocoding_jobs():
+    return (
+        GeocodingJob.objects
+        .retryable()
+        .update(status=GeocodingJob.PENDING, attempts=0)
+    )
+
+
+def claim_geocoding_jobs(batch_size):
+    with transaction.atomic():
+        jobs = list(
+            GeocodingJob.objects
+            .available()
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')[:batch_size]
+        )
+        GeocodingJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            locked_until=timezone.now() + settings.GEOCODING_JOB_LEASE,
+        )
+    return jobs
+
+
+def process_geocoding_jobs(batch_size):
+    # Jobs are claimed in a short transaction, so that the geocoder
+    # requests below do not hold row locks and a database connection.
+    jobs = claim_geocoding_jobs(batch_size)
+    fresh_addresses = set(
+        PlaceCoordinates.objects
+        .fresh()
+        .filter(normalized_address__in=[
+            normalize_address(job.address) for job in jobs
+        ])
+        .values_list('normalized_address', flat=True)
+    )
+    addresses_to_geocode = {}
+    for job in jobs:
+        normalized_address = normalize_address(job.address)
+        if normalized_address not in fresh_addresses:
+            addresses_to_geocode.setdefault(normalized_address, job.address)
+    geocoder = get_geocoder()
+    places_coordinates = geocoder.geocode_many(addresses_to_geocode.values())
+
+    geocoded_jobs_count = 0
+    postponed_jobs_count = 0
+    with transaction.atomic():
+        geocoded_addresses = []
+        for address, place_coordinates in places_coordinates.items():
+            if not isinstance(place_coordinates, Exception):
+                store_coordinates(address, place_coordinates)
+                geocoded_addresses.append(normalize_address(address))
+        if geocoded_addresses:
+            places_geocoded.send(
+                sender=PlaceCoordinates,
+                normalized_addresses=geocoded_addresses,
+            )
+
+        for job in jobs:
+            address = addresses_to_geocode.get(normalize_address(job.address))
+            place_coordinates = places_coordinates.get(address)
+            if isinstance(place_coordinates, geocoder.unavailable_errors):
+                job.last_error = repr(place_coordinates)
+                job.locked_until = None
+                job.save(update_fields=['last_error', 'locked_until'])
+                postponed_jobs_count += 1
+                continue
+            if isinstance(place_coordinates, Exception):
+                job.attempts += 1
+                job.last_error = repr(place_coordinates)
+                job.last_attempt_at = timezone.now()
+                job.locked_until = None
+                if job.attempts >= settings.GEOCODING_MAX_ATTEMPTS:
+                    job.status = GeocodingJob.FAILED
+                job.save(update_fields=[
+                    'attempts',
+                    'last_error',
+                    'last_attempt_at',
+                    'locked_until',
+                    'status',
+                ])
+                continue
+            job.delete()
+            geocoded_jobs_count += 1
+    return GeocodingResult(geocoded_jobs_count, postponed_jobs_count)
+
+
+def get_saved_coordinates(addresses, chunk_size=COORDINATES_CHUNK_SIZE):
+    normalized_addresses = {
+        address: normalize_address(address) for address in set(addresses)
+    }
+    unique_normalized_addresses = list(set(normalized_addresses.values()))
+
+    saved_coords = coordinates_cache.get_many(unique_normalized_addresses)
+    missing_addresses = [
+        normalized_address for normalized_address in unique_normalized_addresses
+        if normalized_address not in saved_coords
+    ]
+
+    found_coords = {}
+    for chunk_start in range(0, len(missing_addresses), chunk_size):
+        saved_places = (
+            PlaceCoordinates.objects
+            .found()
+            .filter(normalized_address__in=missing_addresses[
+                chunk_start:chunk_start + chunk_size
+            ])
+            .values_list('normalized_address', 'lat', 'lon')
+        )
+        for normalized_address, lat, lon in saved_places:
+            found_coords[normalized_address] = Coordinates(float(lat), float(lon))
+    coordinates_cache.set_many(found_coords)
+    saved_coords.update(found_coords)
+
+    return {
+        address: saved_coords.get(normalized_address)
+        for address, normalized_address in normalized_addresses.items()
+    }
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+WGS84_A = 6378.137
+WGS84_B = 6356.752314245
+
+
+def get_earth_radius(lat):
+    # Gaussian radius of curvature of the WGS-84 ellipsoid at given latitude,
+    # keeps haversine within a fraction of a percent of geodesic distance
+    # at city scale.
+    cos_lat = np.cos(lat)
+    sin_lat = np.sin(lat)
+    return (WGS84_A ** 2 * WGS84_B) / (
+        (WGS84_A * cos_lat) ** 2 + (WGS84_B * sin_lat) ** 2
+    )
+
+
+def count_distances(from_coords, to_coords):
+    from_coords = np.radians(np.asarray(from_coords, dtype=float).reshape(-1, 2))
+    to_coords = np.radians(np.asarray(to_coords, dtype=float).reshape(-1, 2))
+
+    from_lat = from_coords[:, 0][:, np.newaxis]
+    from_lon = from_coords[:, 1][:, np.newaxis]
+    to_lat = to_coords[:, 0][np.newaxis, :]
+    to_lon = to_coords[:, 1][np.newaxis, :]
+
+    haversine = (
+        np.sin((to_lat - from_lat) / 2) ** 2
+        + np.cos(from_lat) * np.cos(to_lat) * np.sin((to_lon - from_lon) / 2) ** 2
+    )
+    central_angle = 2 * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
+    return get_earth_radius((from_lat + to_lat) / 2) * central_angle
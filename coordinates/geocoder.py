@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from star_burger.metrics import registry
+
+
+GEOCODING_DURATION = registry.histogram(
+    'starburger_geocoding_duration_seconds',
+    'Время запроса координат адреса у геокодера',
+    ['outcome'],
+)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures_count = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # After reset_timeout one trial request is let through,
+            # the next failure opens the circuit again.
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures_count = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures_count += 1
+            if self._failures_count >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class Geocoder:
+    # Errors that say nothing about the address itself, the lookup is
+    # postponed instead of being counted as a failed attempt.
+    unavailable_errors = (CircuitOpenError,)
+
+    def __init__(self, max_concurrency=1):
+        self.max_concurrency = max_concurrency
+
+    @classmethod
+    def from_settings(cls):
+        return cls(max_concurrency=settings.GEOCODER_MAX_CONCURRENCY)
+
+    def geocode(self, address):
+        raise NotImplementedError
+
+    def observed_geocode(self, address):
+        started_at = time.monotonic()
+        outcome = 'error'
+        try:
+            place_coordinates = self.geocode(address)
+            outcome = 'found' if place_coordinates else 'not_found'
+            return place_coordinates
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            raise
+        finally:
+            GEOCODING_DURATION.observe(time.monotonic() - started_at, outcome=outcome)
+
+    def _geocode_or_error(self, address):
+        try:
+            return self.observed_geocode(address)
+        except Exception as error:
+            return error
+
+    def geocode_many(self, addresses):
+        # Failed lookups are returned as exception instances so that one bad
+        # address does not cancel the whole batch.
+        addresses = list(dict.fromkeys(addresses))
+        if not addresses:
+            return {}
+        max_workers = min(self.max_concurrency, len(addresses))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            found_places = executor.map(self._geocode_or_error, addresses)
+            return dict(zip(addresses, found_places))
+
+
+class YandexGeocoder(Geocoder):
+    retry_statuses = (429, 500, 502, 503, 504)
+    unavailable_errors = (
+        CircuitOpenError,
+        requests.ConnectionError,
+        requests.exceptions.RetryError,
+    )
+
+    def __init__(self, api_key, base_url='https://geocode-maps.yandex.ru/1.x',
+                 connect_timeout=3.05, read_timeout=5, max_retries=2,
+                 backoff_factor=0.3, failure_threshold=5, reset_timeout=30,
+                 max_concurrency=4):
+        super().__init__(max_concurrency=max_concurrency)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.circuit_breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=frozenset(['GET']),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_concurrency,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.YANDEX_API_KEY,
+            base_url=settings.GEOCODER_URL,
+            connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+            read_timeout=settings.GEOCODER_READ_TIMEOUT,
+            max_retries=settings.GEOCODER_MAX_RETRIES,
+            failure_threshold=settings.GEOCODER_FAILURE_THRESHOLD,
+            reset_timeout=settings.GEOCODER_RESET_TIMEOUT,
+            max_concurrency=settings.GEOCODER_MAX_CONCURRENCY,
+        )
+
+    def geocode(self, address):
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError('Геокодер недоступен, запрос не отправлен')
+
+        try:
+            response = self.session.get(self.base_url, params={
+                "geocode": address,
+                "apikey": self.api_key,
+                "format": "json",
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+        except (requests.RequestException, ValueError, KeyError):
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+
+        if not found_places:
+            return None
+
+        most_relevant = found_places[0]
+        lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+        return lat, lon
+
+
+class StubGeocoder(Geocoder):
+    def geocode(self, address):
+        address_hash = int(hashlib.md5(address.encode()).hexdigest(), 16)
+        lat = 55.55 + address_hash % 10000 / 10000 * 0.4
+        lon = 37.35 + address_hash // 10000 % 10000 / 10000 * 0.5
+        return f'{lat:.6f}', f'{lon:.6f}'
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from coordinates.coords_handlers import (
+    enqueue_stale_places,
+    process_geocoding_jobs,
+    retry_failed_geocoding_jobs,
+)
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса из очереди задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='сколько задач брать из очереди за раз',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='разобрать очередь и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            geocoding_result = process_geocoding_jobs(options['batch_size'])
+            if geocoding_result.geocoded:
+                self.stdout.write(f'Геокодировано адресов: {geocoding_result.geocoded}')
+            if geocoding_result.postponed:
+                self.stdout.write(
+                    f'Геокодер недоступен, отложено адресов: {geocoding_result.postponed}'
+                )
+                if options['once']:
+                    break
+                time.sleep(max(options['poll_interval'], settings.GEOCODER_RESET_TIMEOUT))
+                continue
+            if geocoding_result.geocoded:
+                continue
+            if enqueue_stale_places(options['batch_size']):
+                continue
+            if retry_failed_geocoding_jobs():
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
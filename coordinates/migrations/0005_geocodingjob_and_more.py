@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0004_alter_placecoordinates_save_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=200, unique=True, verbose_name='адрес')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('failed', 'Не удалось')], default='pending', max_length=20, verbose_name='статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='поставлен в очередь')),
+            ],
+            options={
+                'verbose_name': 'задача геокодирования',
+                'verbose_name_plural': 'задачи геокодирования',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='geocodingjob',
+            index=models.Index(fields=['status', 'created_at'], name='coordinates_status_775dbf_idx'),
+        ),
+    ]
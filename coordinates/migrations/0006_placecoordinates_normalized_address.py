@@ -0,0 +1,81 @@
+import re
+
+from django.db import migrations, models
+
+
+# A frozen copy of coordinates.addresses.normalize_address: the migration
+# must keep producing the same keys whatever the function turns into later.
+ADDRESS_ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+OMITTED_WORDS = {'г', 'гор', 'город', 'д', 'дом'}
+
+
+def normalize_address(address):
+    words = re.findall(r'\w+(?:-\w+)*', address.lower().replace('ё', 'е'))
+    return ' '.join(
+        ADDRESS_ABBREVIATIONS.get(word, word)
+        for word in words
+        if word not in OMITTED_WORDS
+    )
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    PlaceCoordinates = apps.get_model('coordinates', 'PlaceCoordinates')
+    seen_addresses = set()
+    duplicate_ids = []
+    # Found places and the most recent ones win when several raw addresses
+    # normalize to the same key.
+    places = PlaceCoordinates.objects.order_by('-save_date')
+    for place in sorted(places, key=lambda place: place.lat is None):
+        normalized_address = normalize_address(place.address)
+        if normalized_address in seen_addresses:
+            duplicate_ids.append(place.id)
+            continue
+        seen_addresses.add(normalized_address)
+        place.normalized_address = normalized_address
+        place.save(update_fields=['normalized_address'])
+    PlaceCoordinates.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0005_geocodingjob_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='placecoordinates',
+            name='address',
+            field=models.CharField(db_index=True, max_length=200, unique=True, verbose_name='адрес'),
+        ),
+        migrations.AddField(
+            model_name='placecoordinates',
+            name='normalized_address',
+            field=models.CharField(default='', max_length=200, verbose_name='нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_addresses, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='placecoordinates',
+            name='normalized_address',
+            field=models.CharField(max_length=200, unique=True, verbose_name='нормализованный адрес'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coordinates', '0006_placecoordinates_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodingjob',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='последняя попытка'),
+        ),
+        migrations.AddField(
+            model_name='geocodingjob',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='занята до'),
+        ),
+    ]
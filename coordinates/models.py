@@ -1,13 +1,50 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .addresses import normalize_address
+
+
+# Places the geocoder could not find are kept with empty coordinates,
+# they are negative cache entries and expire after GEOCODE_NEGATIVE_TTL.
+FOUND_PLACE_FILTER = Q(lat__isnull=False, lon__isnull=False)
+
+
+class PlaceCoordinatesQuerySet(models.QuerySet):
+
+    def found(self):
+        return self.filter(FOUND_PLACE_FILTER)
+
+    def get_fresh_filter(self):
+        now = timezone.now()
+        fresh_found_places = FOUND_PLACE_FILTER & Q(
+            save_date__gte=now - settings.GEOCODE_TTL
+        )
+        fresh_not_found_places = ~FOUND_PLACE_FILTER & Q(
+            save_date__gte=now - settings.GEOCODE_NEGATIVE_TTL
+        )
+        return fresh_found_places | fresh_not_found_places
+
+    def fresh(self):
+        return self.filter(self.get_fresh_filter())
+
+    def stale(self):
+        return self.exclude(self.get_fresh_filter())
 
 
 class PlaceCoordinates(models.Model):
     address = models.CharField(
         'адрес',
-        max_length=100,
+        max_length=200,
         unique=True,
         db_index=True
     )
+    normalized_address = models.CharField(
+        'нормализованный адрес',
+        max_length=200,
+        unique=True,
+    )
     lat = models.DecimalField(
         'широта',
         max_digits=8,
@@ -26,9 +63,87 @@ class PlaceCoordinates(models.Model):
         db_index=True
     )
 
+    objects = PlaceCoordinatesQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'координаты места'
         verbose_name_plural = 'координаты мест'
 
     def __str__(self):
         return self.address
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        return super().save(*args, **kwargs)
+
+
+class GeocodingJobQuerySet(models.QuerySet):
+
+    def available(self):
+        # A worker leases jobs while it geocodes them outside of a transaction,
+        # jobs of a worker that died become available when the lease expires.
+        return self.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=timezone.now()),
+            status=GeocodingJob.PENDING,
+        )
+
+    def retryable(self):
+        return self.filter(
+            status=GeocodingJob.FAILED,
+            last_attempt_at__lt=timezone.now() - settings.GEOCODING_FAILED_RETRY_DELAY,
+        )
+
+
+class GeocodingJob(models.Model):
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (FAILED, 'Не удалось'),
+    ]
+
+    address = models.CharField(
+        'адрес',
+        max_length=200,
+        unique=True,
+    )
+    status = models.CharField(
+        'статус',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'попыток',
+        default=0,
+    )
+    last_error = models.TextField(
+        'последняя ошибка',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'поставлен в очередь',
+        default=timezone.now,
+    )
+    last_attempt_at = models.DateTimeField(
+        'последняя попытка',
+        null=True,
+        blank=True,
+    )
+    locked_until = models.DateTimeField(
+        'занята до',
+        null=True,
+        blank=True,
+    )
+
+    objects = GeocodingJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return self.address
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# Sent with normalized_addresses after the geocoding worker stores a batch.
+places_geocoded = Signal()
@@ -0,0 +1,134 @@
+import heapq
+import math
+from collections import defaultdict
+
+from .distances import count_distances
+
+
+KM_PER_LAT_DEGREE = 111.2
+
+
+class PlacesGrid:
+    # Places are bucketed into cells of roughly cell_size_km x cell_size_km.
+    # Queries look at rings of cells around the point and stop as soon as
+    # no place outside the visited rings can be closer than the answer.
+
+    def __init__(self, places_coords, cell_size_km=2):
+        self.cell_size_km = cell_size_km
+        self._cells = defaultdict(list)
+        self._places_coords = dict(places_coords)
+        if not self._places_coords:
+            return
+
+        reference_lat = sum(
+            lat for lat, lon in self._places_coords.values()
+        ) / len(self._places_coords)
+        self._lat_step = cell_size_km / KM_PER_LAT_DEGREE
+        self._lon_step = cell_size_km / (
+            KM_PER_LAT_DEGREE * max(math.cos(math.radians(reference_lat)), 0.01)
+        )
+        for place_id, coords in self._places_coords.items():
+            self._cells[self._get_cell(coords)].append(place_id)
+
+        rows, columns = zip(*self._cells)
+        self._rows_range = (min(rows), max(rows))
+        self._columns_range = (min(columns), max(columns))
+
+    def __len__(self):
+        return len(self._places_coords)
+
+    def _get_cell(self, coords):
+        lat, lon = coords
+        return math.floor(lat / self._lat_step), math.floor(lon / self._lon_step)
+
+    def _iter_ring(self, center_cell, radius):
+        row, column = center_cell
+        if radius == 0:
+            yield center_cell
+            return
+        for column_shift in range(-radius, radius + 1):
+            yield row - radius, column + column_shift
+            yield row + radius, column + column_shift
+        for row_shift in range(-radius + 1, radius):
+            yield row + row_shift, column - radius
+            yield row + row_shift, column + radius
+
+    def _get_max_radius(self, center_cell):
+        row, column = center_cell
+        return max(
+            abs(row - self._rows_range[0]),
+            abs(row - self._rows_range[1]),
+            abs(column - self._columns_range[0]),
+            abs(column - self._columns_range[1]),
+        )
+
+    def _get_covered_distance(self, coords, radius):
+        lat, lon = coords
+        cell_width_km = (
+            self._lon_step * KM_PER_LAT_DEGREE * math.cos(math.radians(lat))
+        )
+        return radius * min(self.cell_size_km, cell_width_km)
+
+    def _count_distances(self, coords, place_ids):
+        distances = count_distances(
+            [coords], [self._places_coords[place_id] for place_id in place_ids]
+        )[0]
+        return zip(distances.tolist(), place_ids)
+
+    def _nearest_among_all(self, coords, limit, allowed_ids=None, max_distance=None):
+        place_ids = [
+            place_id for place_id in self._places_coords
+            if allowed_ids is None or place_id in allowed_ids
+        ]
+        return sorted(
+            (distance, place_id)
+            for distance, place_id in self._count_distances(coords, place_ids)
+            if max_distance is None or distance <= max_distance
+        )[:limit]
+
+    def nearest(self, coords, limit, allowed_ids=None, max_distance=None):
+        if not self._places_coords or limit <= 0:
+            return []
+
+        center_cell = self._get_cell(coords)
+        nearest_places = []
+        visited_cells_count = 0
+        for radius in range(self._get_max_radius(center_cell) + 1):
+            # Far from the places most rings are empty, once they outnumber
+            # the occupied cells checking every place at once is cheaper.
+            if visited_cells_count > len(self._cells):
+                return self._nearest_among_all(coords, limit, allowed_ids, max_distance)
+            visited_cells_count += max(8 * radius, 1)
+
+            ring_place_ids = [
+                place_id
+                for cell in self._iter_ring(center_cell, radius)
+                for place_id in self._cells.get(cell, [])
+                if allowed_ids is None or place_id in allowed_ids
+            ]
+            for distance, place_id in self._count_distances(coords, ring_place_ids):
+                if max_distance is not None and distance > max_distance:
+                    continue
+                if len(nearest_places) < limit:
+                    heapq.heappush(nearest_places, (-distance, place_id))
+                elif -nearest_places[0][0] > distance:
+                    heapq.heapreplace(nearest_places, (-distance, place_id))
+
+            covered_distance = self._get_covered_distance(coords, radius)
+            if max_distance is not None and covered_distance >= max_distance:
+                break
+            if len(nearest_places) == limit and -nearest_places[0][0] <= covered_distance:
+                break
+
+        return sorted(
+            (-negative_distance, place_id)
+            for negative_distance, place_id in nearest_places
+        )
+
+    def within(self, coords, max_distance, allowed_ids=None):
+        return self.nearest(
+            coords,
+            limit=len(self._places_coords),
+            allowed_ids=allowed_ids,
+            max_distance=max_distance,
+        )
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from geopy import distance
+import requests
+
+from .cache import TwoTierCache
+from .coords_handlers import (
+    claim_geocoding_jobs,
+    enqueue_geocoding_many,
+    get_geocoder,
+    process_geocoding_jobs,
+    retry_failed_geocoding_jobs,
+)
+from .distances import count_distances
+from .geocoder import CircuitOpenError, Geocoder, StubGeocoder, YandexGeocoder
+from .models import GeocodingJob, PlaceCoordinates
+from .spatial import PlacesGrid
+
+
+class BrokenGeocoder(Geocoder):
+    def geocode(self, address):
+        raise ValueError('Неожиданный ответ геокодера')
+
+
+class TransactionCheckingGeocoder(StubGeocoder):
+    in_atomic_block = None
+
+    def geocode_many(self, addresses):
+        TransactionCheckingGeocoder.in_atomic_block = connection.in_atomic_block
+        return super().geocode_many(addresses)
+
+
+class FakeGeocoderHandler(BaseHTTPRequestHandler):
+    # The first path segment picks the behaviour: /ok answers right away,
+    # /slow never answers, /unavailable always answers 503 and /flaky
+    # answers 503 to every other request.
+    requests_counts = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        behaviour = url.path.strip('/')
+        requests_count = self.requests_counts.get(behaviour, 0) + 1
+        self.requests_counts[behaviour] = requests_count
+
+        if behaviour == 'slow':
+            time.sleep(0.5)
+            return
+        if behaviour == 'unavailable' or behaviour == 'flaky' and requests_count % 2:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        address = parse_qs(url.query)['geocode'][0]
+        found_places = [{'GeoObject': {'Point': {'pos': '37.617635 55.755814'}}}]
+        if address == 'Неизвестно где':
+            found_places = []
+        geocoder_response = {
+            'response': {'GeoObjectCollection': {'featureMember': found_places}},
+        }
+        if address == 'Сломанный ответ':
+            geocoder_response = {'response': {}}
+        content = json.dumps(geocoder_response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CountDistancesTest(SimpleTestCase):
+
+    def test_matches_geodesic_distances_in_a_city(self):
+        rng = random.Random(0)
+        moscow_coords = [
+            (55.751 + rng.uniform(-0.3, 0.3), 37.618 + rng.uniform(-0.5, 0.5))
+            for _ in range(50)
+        ]
+        distances_matrix = count_distances(moscow_coords[:10], moscow_coords)
+        for from_index, from_coords in enumerate(moscow_coords[:10]):
+            for to_index, to_coords in enumerate(moscow_coords):
+                geodesic_distance = distance.distance(from_coords, to_coords).km
+                self.assertAlmostEqual(
+                    distances_matrix[from_index, to_index],
+                    geodesic_distance,
+                    delta=geodesic_distance * 0.002,
+                )
+
+    def test_matches_geodesic_distances_across_latitudes(self):
+        coords_pairs = [
+            ((59.939, 30.316), (59.951, 30.364)),
+            ((43.116, 131.882), (43.127, 131.911)),
+            ((45.035, 38.975), (45.063, 39.016)),
+        ]
+        for from_coords, to_coords in coords_pairs:
+            geodesic_distance = distance.distance(from_coords, to_coords).km
+            self.assertAlmostEqual(
+                count_distances(from_coords, to_coords)[0, 0],
+                geodesic_distance,
+                delta=geodesic_distance * 0.002,
+            )
+
+
+class PlacesGridTest(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.places_coords = {
+            place_id: (55.751 + rng.uniform(-0.25, 0.25), 37.618 + rng.uniform(-0.45, 0.45))
+            for place_id in range(200)
+        }
+        self.grid = PlacesGrid(self.places_coords)
+
+    def get_nearest(self, coords, limit, allowed_ids=None, max_distance=None):
+        place_ids = [
+            place_id for place_id in self.places_coords
+            if allowed_ids is None or place_id in allowed_ids
+        ]
+        distances = count_distances(
+            [coords], [self.places_coords[place_id] for place_id in place_ids]
+        )[0]
+        return sorted(
+            (distance, place_id)
+            for distance, place_id in zip(distances.tolist(), place_ids)
+            if max_distance is None or distance <= max_distance
+        )[:limit]
+
+    def test_nearest_matches_full_scan(self):
+        rng = random.Random(1)
+        allowed_ids = set(rng.sample(list(self.places_coords), 50))
+        for _ in range(20):
+            coords = (55.751 + rng.uniform(-0.3, 0.3), 37.618 + rng.uniform(-0.5, 0.5))
+            self.assertEqual(self.grid.nearest(coords, 5), self.get_nearest(coords, 5))
+            self.assertEqual(
+                self.grid.nearest(coords, 3, allowed_ids=allowed_ids, max_distance=5),
+                self.get_nearest(coords, 3, allowed_ids=allowed_ids, max_distance=5),
+            )
+
+    def test_far_point_does_not_walk_empty_cells(self):
+        vladivostok_coords = (43.116, 131.882)
+
+        started_at = time.monotonic()
+        nearest_places = self.grid.nearest(vladivostok_coords, 5)
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(nearest_places, self.get_nearest(vladivostok_coords, 5))
+        self.assertEqual(self.grid.nearest(vladivostok_coords, 5, max_distance=10), [])
+
+
+class TwoTierCacheTest(SimpleTestCase):
+
+    def test_clear_by_other_worker_is_seen_after_local_timeout(self):
+        worker_cache = TwoTierCache('test_clear', local_timeout=0.1)
+        other_worker_cache = TwoTierCache('test_clear', local_timeout=0.1)
+        worker_cache.set_many({'key': 'value'})
+
+        other_worker_cache.clear()
+        self.assertEqual(worker_cache.get_many(['key']), {'key': 'value'})
+
+        time.sleep(0.1)
+        self.assertEqual(worker_cache.get_many(['key']), {})
+
+
+class GeocodingQueueTest(TestCase):
+
+    def setUp(self):
+        get_geocoder.cache_clear()
+        self.addCleanup(get_geocoder.cache_clear)
+
+    def test_enqueue_returns_failed_job_to_queue(self):
+        GeocodingJob.objects.create(
+            address='Москва, Тверская, 1',
+            status=GeocodingJob.FAILED,
+            attempts=5,
+        )
+        enqueue_geocoding_many(['Москва, Тверская, 1'])
+
+        job = GeocodingJob.objects.get()
+        self.assertEqual(job.status, GeocodingJob.PENDING)
+        self.assertEqual(job.attempts, 0)
+
+    @override_settings(GEOCODING_FAILED_RETRY_DELAY=timedelta(hours=24))
+    def test_failed_jobs_are_retried_after_delay(self):
+        GeocodingJob.objects.create(
+            address='Москва, Тверская, 1',
+            status=GeocodingJob.FAILED,
+            attempts=5,
+            last_attempt_at=timezone.now() - timedelta(hours=25),
+        )
+        GeocodingJob.objects.create(
+            address='Москва, Тверская, 2',
+            status=GeocodingJob.FAILED,
+            attempts=5,
+            last_attempt_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.assertEqual(retry_failed_geocoding_jobs(), 1)
+        self.assertEqual(
+            GeocodingJob.objects.get(status=GeocodingJob.PENDING).address,
+            'Москва, Тверская, 1',
+        )
+
+    def test_claimed_jobs_are_not_given_to_another_worker(self):
+        GeocodingJob.objects.create(address='Москва, Тверская, 1')
+
+        self.assertEqual(len(claim_geocoding_jobs(10)), 1)
+        self.assertEqual(claim_geocoding_jobs(10), [])
+
+    @override_settings(GEOCODER='coordinates.tests.BrokenGeocoder', GEOCODING_MAX_ATTEMPTS=2)
+    def test_failed_lookups_are_counted_and_released(self):
+        GeocodingJob.objects.create(address='Москва, Тверская, 1')
+
+        self.assertEqual(process_geocoding_jobs(10).geocoded, 0)
+        job = GeocodingJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (GeocodingJob.PENDING, 1))
+        self.assertIsNone(job.locked_until)
+        self.assertIsNotNone(job.last_attempt_at)
+
+        process_geocoding_jobs(10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (GeocodingJob.FAILED, 2))
+
+
+@override_settings(GEOCODER='coordinates.tests.TransactionCheckingGeocoder')
+class GeocodingWorkerTransactionTest(TransactionTestCase):
+
+    def setUp(self):
+        get_geocoder.cache_clear()
+        self.addCleanup(get_geocoder.cache_clear)
+
+    def test_geocoder_is_called_outside_transaction(self):
+        GeocodingJob.objects.create(address='Москва, Тверская, 1')
+
+        self.assertEqual(process_geocoding_jobs(10).geocoded, 1)
+        self.assertIs(TransactionCheckingGeocoder.in_atomic_block, False)
+        self.assertFalse(GeocodingJob.objects.exists())
+        self.assertTrue(PlaceCoordinates.objects.found().exists())
+
+
+class YandexGeocoderTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeocoderHandler)
+        cls.server_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeGeocoderHandler.requests_counts.clear()
+
+    def get_geocoder(self, behaviour, **kwargs):
+        return YandexGeocoder(
+            api_key='test',
+            base_url=f'{self.server_url}/{behaviour}',
+            backoff_factor=0,
+            **kwargs,
+        )
+
+    def test_geocode(self):
+        geocoder = self.get_geocoder('ok')
+
+        self.assertEqual(geocoder.geocode('Москва, Красная площадь'), ('55.755814', '37.617635'))
+        self.assertIsNone(geocoder.geocode('Неизвестно где'))
+
+    def test_retries_read_timeout(self):
+        geocoder = self.get_geocoder('slow', read_timeout=0.1, max_retries=1)
+
+        # Timeouts exhausted through urllib3 retries surface as ConnectionError.
+        with self.assertRaises(requests.ConnectionError):
+            geocoder.geocode('Москва, Красная площадь')
+        self.assertEqual(FakeGeocoderHandler.requests_counts['slow'], 2)
+
+    def test_retries_unavailable_geocoder(self):
+        geocoder = self.get_geocoder('flaky', max_retries=2)
+
+        self.assertEqual(geocoder.geocode('Москва, Красная площадь'), ('55.755814', '37.617635'))
+        self.assertEqual(FakeGeocoderHandler.requests_counts['flaky'], 2)
+
+    def test_gives_up_after_retries(self):
+        geocoder = self.get_geocoder('unavailable', max_retries=2)
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            geocoder.geocode('Москва, Красная площадь')
+        self.assertEqual(FakeGeocoderHandler.requests_counts['unavailable'], 3)
+
+    def test_circuit_breaker_stops_requests(self):
+        geocoder = self.get_geocoder(
+            'unavailable',
+            max_retries=0,
+            failure_threshold=2,
+            reset_timeout=60,
+        )
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RetryError):
+                geocoder.geocode('Москва, Красная площадь')
+
+        with self.assertRaises(CircuitOpenError):
+            geocoder.geocode('Москва, Красная площадь')
+        self.assertEqual(FakeGeocoderHandler.requests_counts['unavailable'], 2)
+
+    def test_circuit_breaker_lets_trial_request_through(self):
+        geocoder = self.get_geocoder(
+            'ok',
+            max_retries=0,
+            failure_threshold=1,
+            reset_timeout=0.1,
+        )
+        with self.assertRaises(KeyError):
+            geocoder.geocode('Сломанный ответ')
+        with self.assertRaises(CircuitOpenError):
+            geocoder.geocode('Москва, Красная площадь')
+
+        time.sleep(0.1)
+        self.assertEqual(geocoder.geocode('Москва, Красная площадь'), ('55.755814', '37.617635'))
+
+    def test_geocode_many_returns_errors_per_address(self):
+        geocoder = self.get_geocoder('ok', max_concurrency=2)
+
+        places_coordinates = geocoder.geocode_many([
+            'Москва, Красная площадь',
+            'Неизвестно где',
+            'Сломанный ответ',
+            'Москва, Красная площадь',
+        ])
+
+        self.assertEqual(len(places_coordinates), 3)
+        self.assertEqual(places_coordinates['Москва, Красная площадь'], ('55.755814', '37.617635'))
+        self.assertIsNone(places_coordinates['Неизвестно где'])
+        self.assertIsInstance(places_coordinates['Сломанный ответ'], KeyError)
+        self.assertEqual(FakeGeocoderHandler.requests_counts['ok'], 3)
+
+
+@override_settings(
+    GEOCODER='coordinates.geocoder.YandexGeocoder',
+    GEOCODER_URL='http://127.0.0.1:9/',
+    GEOCODER_CONNECT_TIMEOUT=0.5,
+    GEOCODER_MAX_RETRIES=0,
+    GEOCODER_FAILURE_THRESHOLD=1,
+)
+class UnavailableGeocoderTest(TestCase):
+
+    def setUp(self):
+        get_geocoder.cache_clear()
+        self.addCleanup(get_geocoder.cache_clear)
+
+    def test_unavailable_geocoder_does_not_use_up_attempts(self):
+        for number in range(3):
+            GeocodingJob.objects.create(address=f'Москва, Тверская, {number}')
+
+        for _ in range(2):
+            geocoding_result = process_geocoding_jobs(10)
+            self.assertEqual(tuple(geocoding_result), (0, 3))
+
+        for job in GeocodingJob.objects.all():
+            self.assertEqual((job.status, job.attempts), (GeocodingJob.PENDING, 0))
+            self.assertIsNone(job.locked_until)
@@ -1,10 +1,14 @@
 from django.contrib import admin
+from django.db import transaction
 from django.shortcuts import reverse, redirect
 from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
-from .models import (Order,
+
+from .candidates import refresh_all_candidates, refresh_order_candidates
+from .models import (Banner,
+                     Order,
                      Product,
                      ProductCategory,
                      ProductInOrder,
@@ -36,6 +40,7 @@ class RestaurantAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if 'address' in form.changed_data:
             obj.save_coords()
+            transaction.on_commit(refresh_all_candidates)
         return super().save_model(request, obj, form, change)
 
 
@@ -121,8 +126,9 @@ class OrderInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', '__str__', 'phonenumber', 'address', 'status']
+    list_display = ['id', '__str__', 'phonenumber', 'address', 'total_price', 'status']
     list_editable = ['status']
+    readonly_fields = ['total_price']
     inlines = [OrderInline]
 
     def response_change(self, request, obj):
@@ -136,9 +142,46 @@ class OrderAdmin(admin.ModelAdmin):
             obj.save_coords()
         return super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        order_id = form.instance.id
+        Order.objects.filter(id=order_id).update_total_price()
+        transaction.on_commit(lambda: refresh_order_candidates([order_id]))
+
 
 @admin.register(ProductInOrder)
 class ProductInOrderAdmin(admin.ModelAdmin):
     list_display = ['__str__', 'product', 'order_price', 'quantity']
     list_editable = ['order_price', 'quantity']
     raw_id_fields = ('product', 'order')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        orders_ids = {obj.order_id, form.initial.get('order')} - {None}
+        Order.objects.filter(id__in=orders_ids).update_total_price()
+        transaction.on_commit(lambda: refresh_order_candidates(orders_ids))
+
+    def delete_model(self, request, obj):
+        order_id = obj.order_id
+        super().delete_model(request, obj)
+        Order.objects.filter(id=order_id).update_total_price()
+        transaction.on_commit(lambda: refresh_order_candidates([order_id]))
+
+    def delete_queryset(self, request, queryset):
+        orders_ids = set(queryset.values_list('order_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Order.objects.filter(id__in=orders_ids).update_total_price()
+        transaction.on_commit(lambda: refresh_order_candidates(orders_ids))
+
+
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = ['get_image_list_preview', 'title', 'text', 'position']
+    list_display_links = ['title']
+    list_editable = ['position']
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html('<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url)
+    get_image_list_preview.short_description = 'превью'
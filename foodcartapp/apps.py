@@ -5,3 +5,5 @@ class FoodcartappConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     name = 'foodcartapp'
 
+    def ready(self):
+        from . import signals  # noqa: F401
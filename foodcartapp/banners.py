@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.templatetags.static import static
+from django.utils.text import compress_string
+
+from .models import Banner, CacheVersion
+from .serialization import dump_api_json
+
+
+BANNERS_VERSION_NAME = 'banners'
+
+DEFAULT_BANNERS = [
+    {
+        'title': 'Burger',
+        'src': 'burger.jpg',
+        'text': 'Tasty Burger at your door step',
+    },
+    {
+        'title': 'Spices',
+        'src': 'food.jpg',
+        'text': 'All Cuisines',
+    },
+    {
+        'title': 'New York',
+        'src': 'tasty.jpg',
+        'text': 'Food is incomplete without a tasty dessert',
+    }
+]
+
+
+def serialize_banners():
+    dumped_banners = [
+        {
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
+        }
+        for banner in Banner.objects.all()
+    ]
+    if not dumped_banners:
+        dumped_banners = [
+            {**banner, 'src': static(banner['src'])} for banner in DEFAULT_BANNERS
+        ]
+    return dump_api_json(dumped_banners)
+
+
+def get_banners_content():
+    banners_version = CacheVersion.objects.get_version(BANNERS_VERSION_NAME)
+    cache_key = f'foodcartapp:banners_content:{banners_version.tag}'
+    banners_content = cache.get(cache_key)
+    if banners_content is None:
+        identity_content = serialize_banners()
+        banners_content = {
+            'identity': identity_content,
+            'gzip': compress_string(identity_content),
+        }
+        cache.set(cache_key, banners_content)
+    return banners_content
+
+
+def invalidate_banners_content():
+    CacheVersion.objects.bump(BANNERS_VERSION_NAME)
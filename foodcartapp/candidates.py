@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from coordinates.addresses import normalize_address
+
+from .models import Order, OrderCandidateRestaurant, ProductInOrder, Restaurant
+
+
+CANDIDATES_CHUNK_SIZE = 500
+
+
+def refresh_order_candidates(orders_ids, chunk_size=CANDIDATES_CHUNK_SIZE):
+    orders_ids = list(set(orders_ids))
+    for chunk_start in range(0, len(orders_ids), chunk_size):
+        chunk_orders_ids = orders_ids[chunk_start:chunk_start + chunk_size]
+        orders = (
+            Order.objects
+            .filter(id__in=chunk_orders_ids)
+            .get_unprocessed()
+            .only('id', 'address')
+            .get_distances()
+        )
+        with transaction.atomic():
+            OrderCandidateRestaurant.objects.filter(
+                order_id__in=chunk_orders_ids,
+            ).delete()
+            OrderCandidateRestaurant.objects.bulk_create([
+                OrderCandidateRestaurant(
+                    order=order,
+                    restaurant=restaurant,
+                    distance=distance,
+                )
+                for order in orders
+                for restaurant, distance in order.available_restaurants
+            ])
+
+
+def refresh_products_candidates(products_ids):
+    orders_ids = (
+        ProductInOrder.objects
+        .filter(product_id__in=products_ids, order__status=Order.UNPROCESSED)
+        .values_list('order_id', flat=True)
+        .distinct()
+    )
+    refresh_order_candidates(orders_ids)
+
+
+def refresh_all_candidates():
+    OrderCandidateRestaurant.objects.exclude(
+        order__status=Order.UNPROCESSED,
+    ).delete()
+    refresh_order_candidates(
+        Order.objects.get_unprocessed().values_list('id', flat=True)
+    )
+
+
+def refresh_places_candidates(normalized_addresses):
+    normalized_addresses = set(normalized_addresses)
+    restaurants_addresses = Restaurant.objects.values_list('address', flat=True)
+    if any(
+        normalize_address(address) in normalized_addresses
+        for address in restaurants_addresses
+    ):
+        refresh_all_candidates()
+        return
+
+    orders = Order.objects.get_unprocessed().values_list('id', 'address')
+    refresh_order_candidates(
+        order_id for order_id, address in orders
+        if normalize_address(address) in normalized_addresses
+    )
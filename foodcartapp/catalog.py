@@ -0,0 +1,38 @@
+import hashlib
+
+from django.core.cache import cache
+
+from .models import CacheVersion
+
+
+CATALOG_VERSION_NAME = 'catalog'
+
+
+def get_catalog_version(request):
+    # ETag, Last-Modified and the content of one request share one lookup.
+    if not hasattr(request, 'catalog_version'):
+        request.catalog_version = CacheVersion.objects.get_version(CATALOG_VERSION_NAME)
+    return request.catalog_version
+
+
+def bump_catalog_version():
+    CacheVersion.objects.bump(CATALOG_VERSION_NAME)
+
+
+def get_catalog_etag(request, *args, **kwargs):
+    return get_catalog_version(request).tag
+
+
+def get_catalog_last_modified(request, *args, **kwargs):
+    return get_catalog_version(request).updated_at.replace(microsecond=0)
+
+
+def get_cached_catalog_content(request, name, build_content):
+    catalog_tag = get_catalog_version(request).tag
+    name_hash = hashlib.md5(name.encode()).hexdigest()
+    cache_key = f'foodcartapp:catalog:{catalog_tag}:{name_hash}'
+    content = cache.get(cache_key)
+    if content is None:
+        content = build_content()
+        cache.set(cache_key, content)
+    return content
@@ -0,0 +1,130 @@
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+
+
+INDEX_VERSION_NAME = 'eligibility_index'
+
+
+def iter_bit_positions(mask):
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+class RestaurantEligibilityIndex:
+    # Bit N of a product mask is set when the restaurant at position N has
+    # the product available. Positions are given to restaurants in a row,
+    # so masks stay as short as the number of restaurants, however large
+    # their ids are. A version counter in the database lets other
+    # processes notice that their copy of the index went stale. Callers
+    # check freshness once with ensure_fresh() before reading masks.
+
+    def __init__(self):
+        self._product_masks = {}
+        self._restaurants_positions = {}
+        self._restaurants_ids = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _get_shared_version(self):
+        cache_version_model = apps.get_model('foodcartapp', 'CacheVersion')
+        return cache_version_model.objects.get_version(INDEX_VERSION_NAME).version
+
+    def _bump_shared_version(self):
+        cache_version_model = apps.get_model('foodcartapp', 'CacheVersion')
+        new_version = cache_version_model.objects.bump(INDEX_VERSION_NAME).version
+        if self._version is not None and new_version == self._version + 1:
+            self._version = new_version
+        else:
+            self._version = None
+
+    def build(self):
+        version = self._get_shared_version()
+        menu_item_model = apps.get_model('foodcartapp', 'RestaurantMenuItem')
+        available_menu_items = (
+            menu_item_model.objects
+            .filter(availability=True)
+            .values_list('restaurant_id', 'product_id')
+        )
+        product_masks = defaultdict(int)
+        restaurants_positions = {}
+        for restaurant_id, product_id in available_menu_items:
+            position = restaurants_positions.setdefault(
+                restaurant_id, len(restaurants_positions)
+            )
+            product_masks[product_id] |= 1 << position
+
+        with self._lock:
+            self._version = version
+            self._product_masks = dict(product_masks)
+            self._restaurants_positions = restaurants_positions
+            self._restaurants_ids = list(restaurants_positions)
+
+    def _get_restaurant_bit(self, restaurant_id):
+        position = self._restaurants_positions.get(restaurant_id)
+        if position is None:
+            position = len(self._restaurants_ids)
+            self._restaurants_positions[restaurant_id] = position
+            self._restaurants_ids.append(restaurant_id)
+        return 1 << position
+
+    def ensure_fresh(self):
+        if self._version is None or self._version != self._get_shared_version():
+            self.build()
+
+    def _get_restaurants_mask(self, product_ids):
+        restaurants_mask = None
+        for product_id in product_ids:
+            product_mask = self._product_masks.get(product_id, 0)
+            if restaurants_mask is None:
+                restaurants_mask = product_mask
+            else:
+                restaurants_mask &= product_mask
+            if not restaurants_mask:
+                return 0
+        return restaurants_mask or 0
+
+    def get_restaurants_ids(self, product_ids):
+        with self._lock:
+            restaurants_mask = self._get_restaurants_mask(product_ids)
+            return [
+                self._restaurants_ids[position]
+                for position in iter_bit_positions(restaurants_mask)
+            ]
+
+    def get_products_masks(self):
+        # Masks and positions are copied together, a rebuild may move
+        # restaurants to other positions.
+        self.ensure_fresh()
+        with self._lock:
+            return dict(self._product_masks), dict(self._restaurants_positions)
+
+    def add(self, restaurant_id, product_id):
+        with self._lock:
+            self._product_masks[product_id] = (
+                self._product_masks.get(product_id, 0)
+                | self._get_restaurant_bit(restaurant_id)
+            )
+            self._bump_shared_version()
+
+    def discard(self, restaurant_id, product_id):
+        with self._lock:
+            product_mask = self._product_masks.get(product_id, 0)
+            if restaurant_id in self._restaurants_positions:
+                product_mask &= ~self._get_restaurant_bit(restaurant_id)
+            if product_mask:
+                self._product_masks[product_id] = product_mask
+            else:
+                self._product_masks.pop(product_id, None)
+            self._bump_shared_version()
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._bump_shared_version()
+
+
+eligibility_index = RestaurantEligibilityIndex()
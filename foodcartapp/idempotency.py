@@ -0,0 +1,87 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def get_request_fingerprint(request):
+    request_data = json.dumps(request.data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{request.path}\n{request_data}'.encode()).hexdigest()
+
+
+def delete_expired_idempotency_keys():
+    expired_keys = IdempotencyKey.objects.filter(
+        created_at__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL,
+    )
+    deleted_count, _ = expired_keys.delete()
+    return deleted_count
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_KEY_HEADER} должен содержать '
+                          f'от 1 до {IDEMPOTENCY_KEY_MAX_LENGTH} символов'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = get_request_fingerprint(request)
+        saved_response = IdempotencyKey.objects.filter(
+            key=key,
+            created_at__gte=timezone.now() - settings.IDEMPOTENCY_KEY_TTL,
+        ).first()
+        if saved_response:
+            if saved_response.request_fingerprint != request_fingerprint:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_KEY_HEADER} уже использован для другого запроса'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            return Response(
+                saved_response.response_data,
+                status=saved_response.response_status,
+                headers={'Idempotent-Replayed': 'true'},
+            )
+
+        with transaction.atomic():
+            response = view(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                return response
+
+            IdempotencyKey.objects.filter(
+                key=key,
+                created_at__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL,
+            ).delete()
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        key=key,
+                        request_fingerprint=request_fingerprint,
+                        response_status=response.status_code,
+                        response_data=response.data,
+                    )
+            except IntegrityError:
+                # A concurrent request with the same key got there first,
+                # everything this one did is rolled back.
+                transaction.set_rollback(True)
+                return Response(
+                    {'error': f'Запрос с таким {IDEMPOTENCY_KEY_HEADER} уже выполняется'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+        return response
+    return wrapper
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.idempotency import delete_expired_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие ключи идемпотентности'
+
+    def handle(self, *args, **options):
+        deleted_count = delete_expired_idempotency_keys()
+        self.stdout.write(f'Удалено ключей: {deleted_count}')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import refresh_all_candidates
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рестораны, которые могут выполнить необработанные заказы'
+
+    def handle(self, *args, **options):
+        refresh_all_candidates()
@@ -0,0 +1,253 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http.response import HttpResponseBase
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from geopy import distance
+
+from coordinates.distances import count_distances
+from foodcartapp.catalog import bump_catalog_version
+from foodcartapp.models import Order, Product, Restaurant, RestaurantMenuItem
+
+
+BENCHMARK_USERNAME = 'benchmark'
+COMPARED_METRICS = ['median_ms', 'queries', 'peak_memory_kib']
+# Orders and restaurants of the distances matrix scenario.
+DISTANCES_MATRIX_SHAPE = (1000, 200)
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_manager_client():
+    manager, _ = get_user_model().objects.get_or_create(
+        username=BENCHMARK_USERNAME,
+        defaults={'is_staff': True},
+    )
+    client = Client()
+    client.force_login(manager)
+    return client
+
+
+def get_order_payload(rng, available_products_ids):
+    return {
+        'firstname': 'Замер',
+        'lastname': 'Производительности',
+        'phonenumber': '+79161234567',
+        'address': 'Москва, Красная площадь, 1',
+        'products': [
+            {'product': product_id, 'quantity': rng.randint(1, 3)}
+            for product_id in rng.sample(
+                available_products_ids,
+                min(len(available_products_ids), 3),
+            )
+        ],
+    }
+
+
+def get_distances_matrix_coords():
+    rng = random.Random(0)
+    orders_count, restaurants_count = DISTANCES_MATRIX_SHAPE
+    orders_coords, restaurants_coords = [
+        [
+            (55.751 + rng.uniform(-0.3, 0.3), 37.618 + rng.uniform(-0.5, 0.5))
+            for _ in range(count)
+        ]
+        for count in (orders_count, restaurants_count)
+    ]
+    return orders_coords, restaurants_coords
+
+
+def compare_distances_with_geopy(count_distances_result):
+    # One geodesic per pair is too slow to repeat, so it is timed once.
+    orders_coords, restaurants_coords = get_distances_matrix_coords()
+    started_at = time.perf_counter()
+    for order_coords in orders_coords:
+        for restaurant_coords in restaurants_coords:
+            distance.distance(order_coords, restaurant_coords).km
+    geopy_ms = (time.perf_counter() - started_at) * 1000
+    return {
+        'geopy_ms': round(geopy_ms, 2),
+        'speedup': round(geopy_ms / count_distances_result['median_ms'], 1),
+    }
+
+
+def get_benchmarks():
+    manager_client = get_manager_client()
+    api_client = Client()
+    rng = random.Random(0)
+    available_products_ids = list(
+        Product.objects.available().values_list('id', flat=True)
+    )
+
+    def register_order():
+        # The created order is rolled back, so repeated runs see the same data.
+        with transaction.atomic():
+            response = api_client.post(
+                '/api/order/',
+                get_order_payload(rng, available_products_ids),
+                content_type='application/json',
+            )
+            transaction.set_rollback(True)
+        return response
+
+    def product_list_api_cold():
+        bump_catalog_version()
+        return api_client.get('/api/products/')
+
+    orders_coords, restaurants_coords = get_distances_matrix_coords()
+
+    return {
+        'view_orders': lambda: manager_client.get(reverse('restaurateur:view_orders')),
+        'view_products': lambda: manager_client.get(reverse('restaurateur:ProductsView')),
+        'product_list_api': lambda: api_client.get('/api/products/'),
+        'product_list_api_cold': product_list_api_cold,
+        'register_order': register_order,
+        'count_distances': lambda: count_distances(orders_coords, restaurants_coords),
+    }
+
+
+def run_benchmark(request, repeat):
+    response = request()
+    timings = []
+    queries_counts = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started_at = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started_at) * 1000)
+        queries_counts.append(len(queries))
+
+    tracemalloc.start()
+    try:
+        request()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': max(queries_counts),
+        'peak_memory_kib': peak_memory // 1024,
+    }
+    # Some scenarios compute something in process instead of requesting a page.
+    if isinstance(response, HttpResponseBase):
+        content = b''.join(response) if response.streaming else response.content
+        result['status'] = response.status_code
+        result['response_kib'] = len(content) // 1024
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время, число запросов к базе и память основных страниц и API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторить каждый замер')
+        parser.add_argument('--output', help='куда записать отчёт в формате JSON')
+        parser.add_argument('--compare', help='отчёт прошлого запуска для сравнения')
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            help='замерить только перечисленные сценарии',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля')
+
+        previous_report = None
+        if options['compare']:
+            with open(options['compare']) as report_file:
+                previous_report = json.load(report_file)
+
+        # The test client talks to the "testserver" host.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            benchmarks = get_benchmarks()
+            if options['only']:
+                unknown_benchmarks = set(options['only']) - set(benchmarks)
+                if unknown_benchmarks:
+                    raise CommandError(
+                        f'Неизвестные сценарии: {", ".join(sorted(unknown_benchmarks))}'
+                    )
+                benchmarks = {name: benchmarks[name] for name in options['only']}
+
+            results = {}
+            for name, request in benchmarks.items():
+                results[name] = run_benchmark(request, options['repeat'])
+                if name == 'count_distances':
+                    results[name].update(compare_distances_with_geopy(results[name]))
+                if name == 'product_list_api_cold':
+                    # The whole catalog is read and dumped without a cached body.
+                    catalog_rows = Product.objects.available().count()
+                    results[name]['rows'] = catalog_rows
+                    results[name]['rows_per_second'] = round(
+                        catalog_rows / results[name]['median_ms'] * 1000
+                    )
+                summary = (
+                    f'{name}: {results[name]["median_ms"]} мс, '
+                    f'запросов {results[name]["queries"]}, '
+                    f'память {results[name]["peak_memory_kib"]} КиБ'
+                )
+                if 'status' in results[name]:
+                    summary += f', код ответа {results[name]["status"]}'
+                if 'rows_per_second' in results[name]:
+                    summary += f', строк в секунду {results[name]["rows_per_second"]}'
+                if 'geopy_ms' in results[name]:
+                    summary += (
+                        f', geopy {results[name]["geopy_ms"]} мс, '
+                        f'быстрее в {results[name]["speedup"]} раз'
+                    )
+                self.stdout.write(summary)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'revision': get_git_revision(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'data': {
+                'restaurants': Restaurant.objects.count(),
+                'products': Product.objects.count(),
+                'menu_items': RestaurantMenuItem.objects.count(),
+                'unprocessed_orders': Order.objects.get_unprocessed().count(),
+            },
+            'results': results,
+        }
+
+        if previous_report:
+            self.stdout.write(f'Сравнение с {previous_report.get("revision")}:')
+            for name, result in results.items():
+                previous_result = previous_report['results'].get(name)
+                if not previous_result:
+                    continue
+                changes = []
+                for metric in COMPARED_METRICS:
+                    if previous_result.get(metric):
+                        change = (result[metric] / previous_result[metric] - 1) * 100
+                        changes.append(f'{metric} {change:+.0f}%')
+                self.stdout.write(f'{name}: {", ".join(changes)}')
+
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(report, report_file, ensure_ascii=False, indent=2)
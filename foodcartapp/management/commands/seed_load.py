@@ -0,0 +1,155 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from coordinates.addresses import normalize_address
+from coordinates.models import PlaceCoordinates
+from foodcartapp.candidates import refresh_all_candidates
+from foodcartapp.catalog import bump_catalog_version
+from foodcartapp.eligibility import eligibility_index
+from foodcartapp.models import (
+    Order,
+    Product,
+    ProductCategory,
+    ProductInOrder,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+BATCH_SIZE = 500
+MOSCOW_CENTER = (55.751, 37.618)
+CITY_RADIUS_DEGREES = 0.25
+
+
+def get_fake_coordinates(rng):
+    lat, lon = MOSCOW_CENTER
+    return (
+        round(lat + rng.uniform(-CITY_RADIUS_DEGREES, CITY_RADIUS_DEGREES), 6),
+        round(lon + rng.uniform(-CITY_RADIUS_DEGREES, CITY_RADIUS_DEGREES) * 1.8, 6),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу тестовыми ресторанами, товарами и заказами для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=50, help='сколько ресторанов создать')
+        parser.add_argument('--products', type=int, default=500, help='сколько товаров создать')
+        parser.add_argument('--categories', type=int, default=10, help='сколько категорий создать')
+        parser.add_argument('--orders', type=int, default=2000, help='сколько заказов создать')
+        parser.add_argument(
+            '--menu-share',
+            type=float,
+            default=0.7,
+            help='доля товаров, которые есть в меню ресторана',
+        )
+        parser.add_argument(
+            '--availability',
+            type=float,
+            default=0.9,
+            help='доля пунктов меню, которые сейчас в продаже',
+        )
+        parser.add_argument(
+            '--max-order-products',
+            type=int,
+            default=5,
+            help='максимум разных товаров в заказе',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        run_id = random.randrange(16 ** 6)
+
+        with transaction.atomic():
+            categories = ProductCategory.objects.bulk_create([
+                ProductCategory(name=f'Нагрузка {run_id:06x} категория {number}')
+                for number in range(options['categories'])
+            ])
+            restaurants = Restaurant.objects.bulk_create([
+                Restaurant(
+                    name=f'Нагрузка {run_id:06x} ресторан {number}',
+                    address=f'Москва, нагрузочная улица {run_id:06x}, {number}',
+                )
+                for number in range(options['restaurants'])
+            ], batch_size=BATCH_SIZE)
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f'Нагрузка {run_id:06x} товар {number}',
+                    category=rng.choice(categories) if categories else None,
+                    price=rng.randint(50, 900),
+                    image='seed_load.png',
+                    special_status=rng.random() < 0.05,
+                )
+                for number in range(options['products'])
+            ], batch_size=BATCH_SIZE)
+
+            menu_items = [
+                RestaurantMenuItem(
+                    restaurant=restaurant,
+                    product=product,
+                    availability=rng.random() < options['availability'],
+                )
+                for restaurant in restaurants
+                for product in products
+                if rng.random() < options['menu_share']
+            ]
+            RestaurantMenuItem.objects.bulk_create(menu_items, batch_size=BATCH_SIZE)
+
+            orders_products = []
+            orders = []
+            for number in range(options['orders']):
+                order_products = rng.sample(
+                    products,
+                    min(len(products), rng.randint(1, options['max_order_products'])),
+                )
+                quantities = [rng.randint(1, 3) for product in order_products]
+                orders_products.append(list(zip(order_products, quantities)))
+                orders.append(Order(
+                    firstname='Нагрузка',
+                    lastname=f'{run_id:06x}-{number}',
+                    phonenumber='+79161234567',
+                    address=f'Москва, заказная улица {run_id:06x}, {number}',
+                    payment_method=rng.choice([Order.CASH, Order.BANK_CARD, Order.ONLINE]),
+                    total_price=sum(
+                        product.price * quantity
+                        for product, quantity in orders_products[-1]
+                    ),
+                ))
+            orders = Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+            ProductInOrder.objects.bulk_create([
+                ProductInOrder(
+                    order=order,
+                    product=product,
+                    quantity=quantity,
+                    order_price=product.price,
+                )
+                for order, order_products in zip(orders, orders_products)
+                for product, quantity in order_products
+            ], batch_size=BATCH_SIZE)
+
+            places = []
+            for place in [*restaurants, *orders]:
+                lat, lon = get_fake_coordinates(rng)
+                places.append(PlaceCoordinates(
+                    address=place.address,
+                    normalized_address=normalize_address(place.address),
+                    lat=lat,
+                    lon=lon,
+                ))
+            PlaceCoordinates.objects.bulk_create(
+                places,
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+
+        eligibility_index.invalidate()
+        bump_catalog_version()
+        refresh_all_candidates()
+
+        self.stdout.write(
+            f'Создано: ресторанов {len(restaurants)}, товаров {len(products)}, '
+            f'пунктов меню {len(menu_items)}, заказов {len(orders)}'
+        )
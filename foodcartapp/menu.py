@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .candidates import refresh_products_candidates
+from .catalog import bump_catalog_version
+from .eligibility import eligibility_index
+from .models import Product, RestaurantMenuItem
+
+
+MENU_ITEMS_BATCH_SIZE = 500
+
+
+def invalidate_menu(products_ids):
+    eligibility_index.invalidate()
+    bump_catalog_version()
+    refresh_products_candidates(products_ids)
+
+
+def set_menu_availability(changes):
+    categories_ids = {change['category'] for change in changes if 'category' in change}
+    categories_products_ids = defaultdict(list)
+    categories_products = (
+        Product.objects
+        .filter(category_id__in=categories_ids)
+        .values_list('category_id', 'id')
+    )
+    for category_id, product_id in categories_products:
+        categories_products_ids[category_id].append(product_id)
+
+    with transaction.atomic():
+        menu_items = {
+            (menu_item.restaurant_id, menu_item.product_id): menu_item
+            for menu_item in (
+                RestaurantMenuItem.objects
+                .select_for_update()
+                .filter(restaurant_id__in={change['restaurant'] for change in changes})
+                .only('id', 'restaurant_id', 'product_id', 'availability')
+            )
+        }
+
+        # Changes are applied in order, so a later change of the same
+        # position wins. A category only switches dishes already on the menu.
+        new_availability = {}
+        for change in changes:
+            restaurant_id = change['restaurant']
+            if 'category' in change:
+                positions = [
+                    (restaurant_id, product_id)
+                    for product_id in categories_products_ids[change['category']]
+                    if (restaurant_id, product_id) in menu_items
+                ]
+            else:
+                positions = [
+                    (restaurant_id, product_id) for product_id in change['products']
+                ]
+            for position in positions:
+                new_availability[position] = change['availability']
+
+        changed_menu_items = []
+        new_menu_items = []
+        for (restaurant_id, product_id), availability in new_availability.items():
+            menu_item = menu_items.get((restaurant_id, product_id))
+            if menu_item is None:
+                if availability:
+                    new_menu_items.append(RestaurantMenuItem(
+                        restaurant_id=restaurant_id,
+                        product_id=product_id,
+                        availability=True,
+                    ))
+            elif menu_item.availability != availability:
+                menu_item.availability = availability
+                changed_menu_items.append(menu_item)
+
+        RestaurantMenuItem.objects.bulk_update(
+            changed_menu_items,
+            ['availability'],
+            batch_size=MENU_ITEMS_BATCH_SIZE,
+        )
+        RestaurantMenuItem.objects.bulk_create(
+            new_menu_items,
+            ignore_conflicts=True,
+            batch_size=MENU_ITEMS_BATCH_SIZE,
+        )
+
+        changed_products_ids = {
+            menu_item.product_id
+            for menu_item in changed_menu_items + new_menu_items
+        }
+        if changed_products_ids:
+            transaction.on_commit(lambda: invalidate_menu(changed_products_ids))
+
+    # bulk_create() does not tell which rows ignore_conflicts skipped,
+    # so added menu items are not counted.
+    return {
+        'updated': len(changed_menu_items),
+    }
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_banner'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='foodcartapp_categor_f6c6ed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['special_status', 'id'], name='foodcartapp_special_393196_idx'),
+        ),
+    ]
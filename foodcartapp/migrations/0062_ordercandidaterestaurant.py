@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0061_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidateRestaurant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True, verbose_name='расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidate_restaurants', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidate_orders', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан для заказа',
+                'verbose_name_plural': 'рестораны для заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordercandidaterestaurant',
+            index=models.Index(fields=['order', 'distance'], name='foodcartapp_order_i_6df200_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ordercandidaterestaurant',
+            unique_together={('order', 'restaurant')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_total_price(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    ProductInOrder = apps.get_model('foodcartapp', 'ProductInOrder')
+
+    products_total_price = (
+        ProductInOrder.objects
+        .filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total_price=Sum(F('quantity') * F('order_price')))
+        .values('total_price')
+    )
+    Order.objects.update(total_price=Coalesce(
+        Subquery(products_total_price),
+        Value(0),
+        output_field=models.DecimalField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0063_order_total_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_total_price, migrations.RunPython.noop),
+    ]
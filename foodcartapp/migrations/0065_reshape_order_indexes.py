@@ -0,0 +1,52 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:40
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0064_fill_order_total_price'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('unprocessed', 'Необработанный'), ('processed', 'Обработанный')], default='unprocessed', max_length=20, verbose_name='Статус заказа'),
+        ),
+        migrations.AlterField(
+            model_name='ordercandidaterestaurant',
+            name='order',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='candidate_restaurants', to='foodcartapp.order', verbose_name='заказ'),
+        ),
+        migrations.AlterField(
+            model_name='productinorder',
+            name='order',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='products_in_order', to='foodcartapp.order', verbose_name='заказ'),
+        ),
+        migrations.AlterField(
+            model_name='productinorder',
+            name='order_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='цена'),
+        ),
+        migrations.AlterField(
+            model_name='productinorder',
+            name='quantity',
+            field=models.SmallIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='количество'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'registered_at', 'id'], name='foodcartapp_status_618cc3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productinorder',
+            index=models.Index(fields=['order', 'product'], name='foodcartapp_order_i_606b6c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurantmenuitem',
+            index=models.Index(fields=['restaurant', 'availability'], name='foodcartapp_restaur_f18bef_idx'),
+        ),
+    ]
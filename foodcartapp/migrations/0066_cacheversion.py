@@ -0,0 +1,27 @@
+# Generated by Django 4.0.4 on 2026-10-18 21:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0065_reshape_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='название')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='версия')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='обновлена')),
+            ],
+            options={
+                'verbose_name': 'версия кэша',
+                'verbose_name_plural': 'версии кэшей',
+            },
+        ),
+    ]
@@ -1,13 +1,28 @@
 from collections import defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
-from django.db.models import F, Sum
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from phonenumber_field.modelfields import PhoneNumberField
 
-from coordinates.coords_handlers import save_coordinates, count_distance
+from coordinates.coords_handlers import (
+    distances_cache,
+    get_saved_coordinates,
+    save_coordinates,
+)
+from coordinates.distances import count_distances
+from coordinates.spatial import PlacesGrid
+
+from .eligibility import eligibility_index
+
+
+# Larger ids would overflow the id columns in the database instead of
+# failing validation.
+MAX_ID = 2 ** 31 - 1
 
 
 class Restaurant(models.Model):
@@ -39,12 +54,11 @@ class Restaurant(models.Model):
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
+        available_menu_items = RestaurantMenuItem.objects.filter(
+            product=OuterRef('pk'),
+            availability=True,
         )
-        return self.filter(pk__in=products)
+        return self.filter(Exists(available_menu_items))
 
 
 class ProductCategory(models.Model):
@@ -99,18 +113,15 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
+        indexes = [
+            models.Index(fields=['category', 'id']),
+            models.Index(fields=['special_status', 'id']),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class RestaurantMenuItemQuerySet(models.QuerySet):
-
-    def get_available_rests_for_products(self):
-        return self.filter(availability=True).prefetch_related('product',
-                                                               'restaurant')
-
-
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -130,14 +141,15 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
-    objects = RestaurantMenuItemQuerySet.as_manager()
-
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            models.Index(fields=['restaurant', 'availability']),
+        ]
 
     def __str__(self):
         return f'{self.restaurant.name} - {self.product.name}'
@@ -145,62 +157,153 @@ class RestaurantMenuItem(models.Model):
 
 class OrderQuerySet(models.QuerySet):
 
-    def get_total_price(self):
-        total_price = self.annotate(
-            total_price=Sum(F('products_in_order__quantity') * F('products_in_order__order_price'))
+    def update_total_price(self):
+        products_total_price = (
+            ProductInOrder.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total_price=Sum(F('quantity') * F('order_price')))
+            .values('total_price')
+        )
+        return self.update(total_price=Coalesce(
+            Subquery(products_total_price),
+            Value(0),
+            output_field=models.DecimalField(),
+        ))
+
+    def get_products_ids(self):
+        orders_products_ids = defaultdict(list)
+        orders_products = (
+            ProductInOrder.objects
+            .filter(order_id__in=[order.id for order in self])
+            .values_list('order_id', 'product_id')
         )
-        return total_price
+        for order_id, product_id in orders_products:
+            orders_products_ids[order_id].append(product_id)
 
-    def get_restaurants(self):
-        return self.prefetch_related('products__menu_items__restaurant')
+        for order in self:
+            order.products_ids = orders_products_ids[order.id]
+        return self
 
     def get_unprocessed(self):
         return self.filter(status='unprocessed')
 
     def get_available_restaurants(self):
-        available_restaurants = defaultdict(list)
-        available_rests_for_products = RestaurantMenuItem.objects.get_available_rests_for_products()
-
-        for rest_menu_item in available_rests_for_products:
-            available_restaurants[rest_menu_item.product].append(
-                rest_menu_item.restaurant)
+        if any(not hasattr(order, 'products_ids') for order in self):
+            self.get_products_ids()
 
-        for order in self:
-            order_products_restaurants = []
-            order_products = order.products.all()
-
-            for product in order_products:
-                order_products_restaurants.append(
-                    available_restaurants[product])
-
-            order_restaurants = set.intersection(
-                *map(set, order_products_restaurants))
+        eligibility_index.ensure_fresh()
+        orders_restaurants_ids = [
+            (order, eligibility_index.get_restaurants_ids(order.products_ids))
+            for order in self
+        ]
 
-            order.available_restaurants = order_restaurants
+        restaurants_ids = set()
+        for order, order_restaurants_ids in orders_restaurants_ids:
+            restaurants_ids.update(order_restaurants_ids)
+        restaurants = Restaurant.objects.in_bulk(restaurants_ids)
+
+        for order, order_restaurants_ids in orders_restaurants_ids:
+            order.available_restaurants = {
+                restaurants[restaurant_id]
+                for restaurant_id in order_restaurants_ids
+                if restaurant_id in restaurants
+            }
         return self
 
     def get_distances(self):
-        places_coords = defaultdict(tuple)
+        if any(not hasattr(order, 'available_restaurants') for order in self):
+            self.get_available_restaurants()
+
+        places_coords = get_saved_coordinates(
+            [order.address for order in self]
+            + [
+                restaurant.address
+                for order in self
+                for restaurant in order.available_restaurants
+            ]
+        )
+        restaurants_grid = PlacesGrid({
+            restaurant.id: places_coords[restaurant.address]
+            for order in self
+            for restaurant in order.available_restaurants
+            if places_coords[restaurant.address]
+        })
+
+        distances_keys = {}
+        for order in self:
+            if not places_coords[order.address]:
+                continue
+            nearest_restaurants = restaurants_grid.nearest(
+                places_coords[order.address],
+                limit=settings.ORDER_RESTAURANTS_LIMIT,
+                allowed_ids={restaurant.id for restaurant in order.available_restaurants},
+                max_distance=settings.ORDER_RESTAURANTS_RADIUS_KM,
+            )
+            nearest_restaurants_ids = {
+                restaurant_id for distance, restaurant_id in nearest_restaurants
+            }
+            for restaurant in order.available_restaurants:
+                if restaurant.id in nearest_restaurants_ids:
+                    # Keyed on coordinates, so a distance never outlives them.
+                    distances_keys[(order, restaurant)] = (
+                        *places_coords[restaurant.address],
+                        *places_coords[order.address],
+                    )
+        distances = distances_cache.get_many(distances_keys.values())
+
+        missing_pairs = [
+            pair for pair, distance_key in distances_keys.items()
+            if distance_key not in distances
+        ]
+        if missing_pairs:
+            orders = list({order for order, restaurant in missing_pairs})
+            restaurants = list({restaurant for order, restaurant in missing_pairs})
+            orders_rows = {order: row for row, order in enumerate(orders)}
+            restaurants_columns = {
+                restaurant: column for column, restaurant in enumerate(restaurants)
+            }
+            distances_matrix = count_distances(
+                [places_coords[order.address] for order in orders],
+                [places_coords[restaurant.address] for restaurant in restaurants],
+            )
+            missing_distances = {
+                distances_keys[(order, restaurant)]: round(float(distances_matrix[
+                    orders_rows[order], restaurants_columns[restaurant]
+                ]), 2)
+                for order, restaurant in missing_pairs
+            }
+            distances_cache.set_many(missing_distances)
+            distances.update(missing_distances)
+
         for order in self:
-            try:
-                order.available_restaurants
-            except AttributeError:
-                self.get_available_restaurants()
-            finally:
-                order_restaurants_w_distances = [(restaurant.name,
-                                                  count_distance(
-                                                      restaurant.address,
-                                                      order.address,
-                                                      places_coords))
-                                                 for restaurant in
-                                                 order.available_restaurants]
-
-                order.available_restaurants = sorted(
-                    order_restaurants_w_distances,
-                    key=lambda rest_data:
-                    rest_data[1])
+            order_restaurants_w_distances = []
+            for restaurant in order.available_restaurants:
+                distance_key = distances_keys.get((order, restaurant))
+                if distance_key:
+                    distance = distances[distance_key]
+                elif places_coords[order.address] and places_coords[restaurant.address]:
+                    continue
+                else:
+                    distance = None
+                order_restaurants_w_distances.append((restaurant, distance))
+
+            order.available_restaurants = sorted(
+                order_restaurants_w_distances,
+                key=lambda rest_data: (rest_data[1] is None, rest_data[1] or 0)
+            )
         return self
 
+    def get_candidate_restaurants(self):
+        candidates = (
+            OrderCandidateRestaurant.objects
+            .select_related('restaurant')
+            .order_by(F('distance').asc(nulls_last=True), 'restaurant__name')
+        )
+        return self.prefetch_related(
+            models.Prefetch('candidate_restaurants', queryset=candidates)
+        )
+
 
 class Order(models.Model):
     PROCESSED = 'processed'
@@ -225,7 +328,6 @@ class Order(models.Model):
         max_length=20,
         choices=STATUS_CHOICES,
         default=UNPROCESSED,
-        db_index=True
     )
     payment_method = models.CharField(
         verbose_name='Способ оплаты',
@@ -244,6 +346,13 @@ class Order(models.Model):
         related_name='orders',
         )
     comment = models.TextField('комментарий', blank=True)
+    total_price = models.DecimalField(
+        'стоимость',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+    )
     registered_at = models.DateTimeField(
         'Создан',
         default=timezone.now,
@@ -267,6 +376,9 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            models.Index(fields=['status', 'registered_at', 'id']),
+        ]
 
     def __str__(self):
         return f'{self.lastname} {self.firstname}'
@@ -287,23 +399,162 @@ class ProductInOrder(models.Model):
         on_delete=models.CASCADE,
         verbose_name='заказ',
         related_name='products_in_order',
+        db_index=False,
     )
     quantity = models.SmallIntegerField(
         verbose_name='количество',
         validators=[MinValueValidator(1)],
-        db_index=True
     )
     order_price = models.DecimalField(
         verbose_name='цена',
         max_digits=8,
         decimal_places=2,
         validators=[MinValueValidator(0)],
-        db_index=True
     )
 
     class Meta:
         verbose_name = 'Товары в заказе'
         verbose_name_plural = 'Товары в заказе'
+        indexes = [
+            models.Index(fields=['order', 'product']),
+        ]
 
     def __str__(self):
         return f'{self.order.id} | {self.order}'
+
+
+class OrderCandidateRestaurant(models.Model):
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        verbose_name='заказ',
+        related_name='candidate_restaurants',
+        db_index=False,
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        on_delete=models.CASCADE,
+        verbose_name='ресторан',
+        related_name='candidate_orders',
+    )
+    distance = models.DecimalField(
+        'расстояние, км',
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'ресторан для заказа'
+        verbose_name_plural = 'рестораны для заказов'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+        indexes = [
+            models.Index(fields=['order', 'distance']),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id} - {self.restaurant}'
+
+
+class Banner(models.Model):
+    title = models.CharField(
+        'заголовок',
+        max_length=50,
+    )
+    image = models.ImageField(
+        'картинка',
+        upload_to='banners',
+    )
+    text = models.CharField(
+        'текст',
+        max_length=200,
+        blank=True,
+    )
+    position = models.PositiveIntegerField(
+        'порядок',
+        default=0,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.title
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'ключ',
+        max_length=255,
+        unique=True,
+    )
+    request_fingerprint = models.CharField(
+        'отпечаток запроса',
+        max_length=64,
+    )
+    response_status = models.PositiveSmallIntegerField('код ответа')
+    response_data = models.JSONField('ответ')
+    created_at = models.DateTimeField(
+        'создан',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+
+class CacheVersionQuerySet(models.QuerySet):
+
+    def get_version(self, name):
+        cache_version, _ = self.get_or_create(name=name)
+        return cache_version
+
+    def bump(self, name):
+        with transaction.atomic():
+            bumped = self.filter(name=name).update(
+                version=F('version') + 1,
+                updated_at=timezone.now(),
+            )
+            if not bumped:
+                self.get_or_create(name=name)
+            return self.get(name=name)
+
+
+class CacheVersion(models.Model):
+    name = models.CharField(
+        'название',
+        max_length=50,
+        unique=True,
+    )
+    version = models.PositiveIntegerField(
+        'версия',
+        default=1,
+    )
+    updated_at = models.DateTimeField(
+        'обновлена',
+        default=timezone.now,
+    )
+
+    objects = CacheVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'версия кэша'
+        verbose_name_plural = 'версии кэшей'
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
+
+    @property
+    def tag(self):
+        return f'{self.version}-{self.updated_at.timestamp():.6f}'
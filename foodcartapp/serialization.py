@@ -0,0 +1,18 @@
+import json
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def dumps_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def dumps_orjson(data):
+    import orjson
+    return orjson.dumps(data)
+
+
+def dump_api_json(data):
+    dumps = import_string(settings.API_JSON_DUMPS)
+    return dumps(data)
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from coordinates.models import PlaceCoordinates
+from coordinates.signals import places_geocoded
+
+from .banners import invalidate_banners_content
+from .candidates import refresh_places_candidates, refresh_products_candidates
+from .catalog import bump_catalog_version
+from .eligibility import eligibility_index
+from .models import Banner, Product, ProductCategory, RestaurantMenuItem
+
+
+@receiver(pre_save, sender=RestaurantMenuItem)
+def remember_menu_item_position(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        instance.previous_position = None
+        return
+    instance.previous_position = (
+        RestaurantMenuItem.objects
+        .filter(pk=instance.pk)
+        .values_list('restaurant_id', 'product_id')
+        .first()
+    )
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_eligibility_index(sender, instance, raw, **kwargs):
+    if raw:
+        transaction.on_commit(eligibility_index.invalidate)
+        return
+
+    previous_position = getattr(instance, 'previous_position', None)
+    position = (instance.restaurant_id, instance.product_id)
+
+    def apply_changes():
+        if previous_position and previous_position != position:
+            eligibility_index.discard(*previous_position)
+        if instance.availability:
+            eligibility_index.add(*position)
+        else:
+            eligibility_index.discard(*position)
+
+        products_ids = {instance.product_id}
+        if previous_position:
+            products_ids.add(previous_position[1])
+        refresh_products_candidates(products_ids)
+
+    transaction.on_commit(apply_changes)
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def discard_from_eligibility_index(sender, instance, **kwargs):
+    position = (instance.restaurant_id, instance.product_id)
+
+    def apply_changes():
+        eligibility_index.discard(*position)
+        refresh_products_candidates([instance.product_id])
+
+    transaction.on_commit(apply_changes)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners(sender, **kwargs):
+    transaction.on_commit(invalidate_banners_content)
+
+
+@receiver(places_geocoded, sender=PlaceCoordinates)
+def refresh_geocoded_candidates(sender, normalized_addresses, **kwargs):
+    transaction.on_commit(lambda: refresh_places_candidates(normalized_addresses))
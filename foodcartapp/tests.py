@@ -0,0 +1,647 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from coordinates.coords_handlers import (
+    coordinates_cache,
+    enqueue_geocoding_many,
+    get_geocoder,
+    process_geocoding_jobs,
+    store_coordinates,
+)
+from coordinates.models import GeocodingJob, PlaceCoordinates
+from .candidates import refresh_order_candidates
+from .eligibility import RestaurantEligibilityIndex, eligibility_index
+from .models import (
+    Banner,
+    CacheVersion,
+    IdempotencyKey,
+    Order,
+    OrderCandidateRestaurant,
+    Product,
+    ProductInOrder,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+# SQLite reports a full table read as "SCAN <table>" without an index,
+# PostgreSQL as "Seq Scan on <table>".
+SEQUENTIAL_SCAN_RE = re.compile(
+    r'\bSCAN (?P<sqlite_table>\w+)(?! USING)\b|Seq Scan on (?P<postgres_table>\w+)'
+)
+
+
+class RestaurantEligibilityIndexTest(TestCase):
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Ресторан')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.png')
+        # Versions are rolled back after every test, the module index is not.
+        eligibility_index.invalidate()
+
+    def test_other_process_notices_menu_changes(self):
+        # Another process has its own copy of the index and only shares
+        # the version in the database with this one.
+        other_index = RestaurantEligibilityIndex()
+        other_index.ensure_fresh()
+        self.assertEqual(other_index.get_restaurants_ids([self.product.id]), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(
+                restaurant=self.restaurant,
+                product=self.product,
+                availability=True,
+            )
+
+        other_index.ensure_fresh()
+        self.assertEqual(
+            other_index.get_restaurants_ids([self.product.id]),
+            [self.restaurant.id],
+        )
+
+    def test_large_restaurant_ids_get_dense_positions(self):
+        restaurant = Restaurant.objects.create(id=10 ** 9, name='Другой ресторан')
+        for menu_restaurant in (self.restaurant, restaurant):
+            RestaurantMenuItem.objects.create(
+                restaurant=menu_restaurant,
+                product=self.product,
+                availability=True,
+            )
+
+        eligibility_index.ensure_fresh()
+        products_masks, restaurants_positions = eligibility_index.get_products_masks()
+        self.assertEqual(products_masks[self.product.id], 0b11)
+        self.assertEqual(set(restaurants_positions.values()), {0, 1})
+        self.assertEqual(
+            sorted(eligibility_index.get_restaurants_ids([self.product.id])),
+            [self.restaurant.id, restaurant.id],
+        )
+
+        # A restaurant added later gets the next position without a rebuild.
+        new_restaurant = Restaurant.objects.create(id=2 * 10 ** 9, name='Новый ресторан')
+        eligibility_index.add(new_restaurant.id, self.product.id)
+        eligibility_index.discard(restaurant.id, self.product.id)
+        self.assertEqual(
+            sorted(eligibility_index.get_restaurants_ids([self.product.id])),
+            [self.restaurant.id, new_restaurant.id],
+        )
+
+    def test_available_restaurants_check_index_version_once(self):
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant,
+            product=self.product,
+            availability=True,
+        )
+        orders = Order.objects.bulk_create([
+            Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                address=f'Москва, улица, {number}',
+            )
+            for number in range(3)
+        ])
+        ProductInOrder.objects.bulk_create([
+            ProductInOrder(order=order, product=self.product, quantity=1, order_price=100)
+            for order in orders
+        ])
+        eligibility_index.ensure_fresh()
+
+        # Orders, their products, the index version and restaurants.
+        with self.assertNumQueries(4):
+            orders = list(Order.objects.all().get_available_restaurants())
+        for order in orders:
+            self.assertEqual(order.available_restaurants, {self.restaurant})
+
+
+class CacheVersionTest(TestCase):
+
+    def test_bump_creates_and_increments_version(self):
+        self.assertEqual(CacheVersion.objects.bump('catalog').version, 1)
+        self.assertEqual(CacheVersion.objects.bump('catalog').version, 2)
+        self.assertEqual(CacheVersion.objects.get_version('catalog').version, 2)
+
+
+class ProductListApiTest(TestCase):
+
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Ресторан')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.png')
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=self.product,
+            availability=True,
+        )
+
+    def test_catalog_change_replaces_etag(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 150
+            self.product.save()
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], '150.00')
+
+    def test_unknown_parameters_share_cached_content(self):
+        self.client.get('/api/products/', {'limit': 1, 'special_status': 'False'})
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', {
+                'special_status': '0',
+                'limit': '1',
+                'utm_source': 'mail',
+            })
+        self.assertEqual(response.json()['results'][0]['id'], self.product.id)
+        self.assertIsNone(response.json()['next'])
+
+    def test_next_page_url_keeps_parsed_query(self):
+        Product.objects.create(name='Картошка', price=50, image='potato.png')
+        RestaurantMenuItem.objects.create(
+            restaurant=Restaurant.objects.get(),
+            product=Product.objects.get(name='Картошка'),
+            availability=True,
+        )
+
+        response = self.client.get('/api/products/', {
+            'fields': 'name',
+            'limit': 1,
+            'utm_source': 'mail',
+        })
+        next_page_url = response.json()['next']
+        self.assertNotIn('utm_source', next_page_url)
+        self.assertEqual(self.client.get(next_page_url).json(), {
+            'results': [{'name': 'Картошка'}],
+            'next': None,
+        })
+
+    def test_cached_catalog_costs_one_query(self):
+        self.client.get('/api/products/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/products/')
+
+
+class BannersListApiTest(TestCase):
+
+    def test_banner_changes_replace_cached_content(self):
+        self.assertEqual(len(self.client.get('/api/banners/').json()), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Banner.objects.create(title='Акция', image='banners/sale.jpg')
+
+        banners = self.client.get('/api/banners/').json()
+        self.assertEqual([banner['title'] for banner in banners], ['Акция'])
+
+
+class OrderDistancesTest(TestCase):
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name='Ресторан',
+            address='Москва, Тверская, 1',
+        )
+        product = Product.objects.create(name='Бургер', price=100, image='burger.png')
+        RestaurantMenuItem.objects.create(
+            restaurant=self.restaurant,
+            product=product,
+            availability=True,
+        )
+        self.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Арбат, 10',
+        )
+        ProductInOrder.objects.create(
+            order=self.order,
+            product=product,
+            quantity=1,
+            order_price=100,
+        )
+        # Cached coordinates outlive the rolled back test data.
+        cache.clear()
+        coordinates_cache.clear()
+        store_coordinates(self.restaurant.address, ('55.757', '37.613'))
+        store_coordinates(self.order.address, ('55.751', '37.595'))
+        eligibility_index.invalidate()
+
+    def get_distance(self):
+        order = Order.objects.filter(id=self.order.id).get_distances()[0]
+        [(restaurant, distance)] = order.available_restaurants
+        self.assertEqual(restaurant, self.restaurant)
+        return distance
+
+    def test_distance_follows_new_coordinates(self):
+        self.assertAlmostEqual(self.get_distance(), 1.3, delta=0.1)
+
+        store_coordinates(self.order.address, ('55.757', '37.723'))
+        self.assertAlmostEqual(self.get_distance(), 7.0, delta=0.1)
+
+    def test_admin_bulk_delete_updates_orders(self):
+        other_product = Product.objects.create(name='Торт', price=500, image='cake.png')
+        ProductInOrder.objects.create(
+            order=self.order,
+            product=other_product,
+            quantity=1,
+            order_price=500,
+        )
+        Order.objects.filter(id=self.order.id).update_total_price()
+        refresh_order_candidates([self.order.id])
+        self.assertFalse(OrderCandidateRestaurant.objects.exists())
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:foodcartapp_productinorder_changelist'),
+                {
+                    'action': 'delete_selected',
+                    '_selected_action': [
+                        ProductInOrder.objects.get(product=other_product).id,
+                    ],
+                    'post': 'yes',
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 100)
+        self.assertEqual(
+            list(OrderCandidateRestaurant.objects.values_list('order_id', 'restaurant_id')),
+            [(self.order.id, self.restaurant.id)],
+        )
+
+
+@override_settings(GEOCODER='coordinates.geocoder.StubGeocoder')
+class OrderCandidatesTest(TestCase):
+
+    def setUp(self):
+        get_geocoder.cache_clear()
+        self.addCleanup(get_geocoder.cache_clear)
+        cache.clear()
+        coordinates_cache.clear()
+        eligibility_index.invalidate()
+
+        self.near_restaurant, self.far_restaurant = Restaurant.objects.bulk_create([
+            Restaurant(name='Рядом', address='Москва, Тверская, 1'),
+            Restaurant(name='Далеко', address='Санкт-Петербург, Невский, 1'),
+        ])
+        store_coordinates(self.near_restaurant.address, ('55.757', '37.613'))
+        store_coordinates(self.far_restaurant.address, ('59.932', '30.349'))
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.png')
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=self.product, availability=True)
+            for restaurant in (self.near_restaurant, self.far_restaurant)
+        ])
+        self.order = self.create_order('Москва, Арбат, 10')
+        store_coordinates(self.order.address, ('55.751', '37.595'))
+        refresh_order_candidates([self.order.id])
+
+    def create_order(self, address):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address=address,
+        )
+        ProductInOrder.objects.create(
+            order=order,
+            product=self.product,
+            quantity=1,
+            order_price=100,
+        )
+        return order
+
+    def get_candidates_distances(self):
+        stored_distances = {
+            (candidate.order_id, candidate.restaurant_id): candidate.distance
+            for candidate in OrderCandidateRestaurant.objects.all()
+        }
+        distances = {
+            (order.id, restaurant.id): distance
+            for order in Order.objects.get_unprocessed().get_distances()
+            for restaurant, distance in order.available_restaurants
+        }
+        self.assertEqual(stored_distances.keys(), distances.keys())
+        for pair, distance in distances.items():
+            if distance is None:
+                self.assertIsNone(stored_distances[pair])
+            else:
+                self.assertAlmostEqual(float(stored_distances[pair]), distance, delta=0.005)
+        return distances
+
+    def test_menu_availability_change(self):
+        near_menu_item = RestaurantMenuItem.objects.get(restaurant=self.near_restaurant)
+        with self.captureOnCommitCallbacks(execute=True):
+            near_menu_item.availability = False
+            near_menu_item.save()
+        self.assertEqual(
+            self.get_candidates_distances().keys(),
+            {(self.order.id, self.far_restaurant.id)},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            near_menu_item.availability = True
+            near_menu_item.save()
+        self.assertEqual(len(self.get_candidates_distances()), 2)
+
+    def test_restaurant_address_change(self):
+        far_distance = self.get_candidates_distances()[(self.order.id, self.far_restaurant.id)]
+        self.assertGreater(far_distance, 600)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        menu_item = RestaurantMenuItem.objects.get(restaurant=self.far_restaurant)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:foodcartapp_restaurant_change', args=[self.far_restaurant.id]),
+                {
+                    'name': self.far_restaurant.name,
+                    'address': 'Москва, Новый Арбат, 2',
+                    'contact_phone': '',
+                    'menu_items-TOTAL_FORMS': 1,
+                    'menu_items-INITIAL_FORMS': 1,
+                    'menu_items-0-id': menu_item.id,
+                    'menu_items-0-restaurant': self.far_restaurant.id,
+                    'menu_items-0-product': self.product.id,
+                    'menu_items-0-availability': 'on',
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+
+        far_distance = self.get_candidates_distances()[(self.order.id, self.far_restaurant.id)]
+        self.assertLess(far_distance, 50)
+
+    def test_worker_geocodes_order_address(self):
+        order = self.create_order('Москва, Лесная, 5')
+        enqueue_geocoding_many([order.address])
+        refresh_order_candidates([order.id])
+        self.assertIsNone(self.get_candidates_distances()[(order.id, self.near_restaurant.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_geocoding_jobs(10).geocoded, 1)
+
+        distances = self.get_candidates_distances()
+        self.assertIsNotNone(distances[(order.id, self.near_restaurant.id)])
+        self.assertIsNotNone(distances[(order.id, self.far_restaurant.id)])
+
+
+class RegisterOrderTest(TestCase):
+
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Ресторан', address='Москва, Тверская, 1')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Бургер {number}', price=100, image='burger.png')
+            for number in range(20)
+        ])
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product, availability=True)
+            for product in self.products
+        ])
+        eligibility_index.invalidate()
+        cache.clear()
+        coordinates_cache.clear()
+
+    def get_order_data(self, products):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Арбат, 10',
+            'products': products,
+        }
+
+    def test_register_order_queries(self):
+        eligibility_index.ensure_fresh()
+
+        # The number of queries does not depend on the size of the cart.
+        for cart_size in [1, 20]:
+            order_data = self.get_order_data([
+                {'product': product.id, 'quantity': 2} for product in self.products[:cart_size]
+            ])
+
+            # Products, the order and its products, the geocoding queue and
+            # the candidate restaurants, with savepoints around them.
+            with self.subTest(cart_size=cart_size), self.assertNumQueries(17):
+                response = self.client.post(
+                    '/api/order/',
+                    order_data,
+                    content_type='application/json',
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(Order.objects.latest('id').total_price, cart_size * 200)
+
+    def test_batch_accepts_product_ids_as_strings(self):
+        orders_data = [
+            self.get_order_data([{'product': str(self.products[0].id), 'quantity': 1}]),
+            self.get_order_data([{'product': f'{self.products[1].id}.0', 'quantity': 1}]),
+        ]
+
+        response = self.client.post(
+            '/api/orders/batch/',
+            orders_data,
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+
+    def test_too_large_numbers_are_rejected(self):
+        for products in [
+            [{'product': 10 ** 30, 'quantity': 1}],
+            [{'product': self.products[0].id, 'quantity': 10 ** 30}],
+        ]:
+            response = self.client.post(
+                '/api/order/',
+                self.get_order_data(products),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400)
+
+            response = self.client.post(
+                '/api/orders/batch/',
+                [self.get_order_data(products)],
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'][0]['status'], 'invalid')
+
+    def test_too_large_total_price_is_rejected(self):
+        product = Product.objects.create(name='Торт', price=99999, image='cake.png')
+        RestaurantMenuItem.objects.create(
+            restaurant=Restaurant.objects.get(),
+            product=product,
+            availability=True,
+        )
+        products = [{'product': product.id, 'quantity': 2 ** 15 - 1}]
+
+        response = self.client.post(
+            '/api/order/',
+            self.get_order_data(products),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            '/api/orders/batch/',
+            [self.get_order_data(products)],
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['results'][0]['status'], 'invalid')
+        self.assertFalse(Order.objects.exists())
+
+
+class IdempotencyKeyTest(TestCase):
+
+    def setUp(self):
+        restaurant = Restaurant.objects.create(name='Ресторан', address='Москва, Тверская, 1')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.png')
+        RestaurantMenuItem.objects.create(
+            restaurant=restaurant,
+            product=self.product,
+            availability=True,
+        )
+        eligibility_index.invalidate()
+        cache.clear()
+        coordinates_cache.clear()
+
+    def register_order(self, quantity=1, key='order-1'):
+        return self.client.post(
+            '/api/order/',
+            {
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79161234567',
+                'address': 'Москва, Арбат, 10',
+                'products': [{'product': self.product.id, 'quantity': quantity}],
+            },
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_saved_response(self):
+        response = self.register_order()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+        replayed_response = self.register_order()
+        self.assertEqual(replayed_response.status_code, 200)
+        self.assertEqual(replayed_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed_response.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(GeocodingJob.objects.count(), 1)
+
+    def test_other_request_with_same_key_is_rejected(self):
+        self.register_order()
+
+        response = self.register_order(quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_key_can_be_reused(self):
+        self.register_order()
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - settings.IDEMPOTENCY_KEY_TTL - timedelta(seconds=1),
+        )
+
+        response = self.register_order(quantity=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_malformed_key_is_rejected(self):
+        for key in ['', 'x' * 256]:
+            response = self.register_order(key=key)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class QueryPlansTest(TestCase):
+    # Main queries of the site must be able to use an index. Run the tests
+    # against PostgreSQL as well after changing models or queries.
+
+    def assertUsesIndexes(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # On small tables the planner prefers a sequential scan anyway,
+                # so ask whether an index could be used at all.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        scanned_tables = [
+            sqlite_table or postgres_table
+            for sqlite_table, postgres_table in SEQUENTIAL_SCAN_RE.findall(plan)
+        ]
+        self.assertEqual(scanned_tables, [], plan)
+
+    def test_unprocessed_orders(self):
+        self.assertUsesIndexes(
+            Order.objects
+            .get_unprocessed()
+            .filter(
+                Q(registered_at__gt=timezone.now())
+                | Q(registered_at=timezone.now(), id__gt=1)
+            )
+            .order_by('registered_at', 'id')
+        )
+
+    def test_orders_products(self):
+        self.assertUsesIndexes(
+            ProductInOrder.objects
+            .filter(order_id__in=[1, 2, 3])
+            .values_list('order_id', 'product_id')
+        )
+
+    def test_unprocessed_orders_with_products(self):
+        self.assertUsesIndexes(
+            ProductInOrder.objects
+            .filter(product_id__in=[1, 2, 3], order__status=Order.UNPROCESSED)
+            .values_list('order_id', flat=True)
+        )
+
+    def test_orders_candidate_restaurants(self):
+        self.assertUsesIndexes(
+            OrderCandidateRestaurant.objects
+            .filter(order_id__in=[1, 2, 3])
+            .select_related('restaurant')
+        )
+
+    def test_restaurant_menu(self):
+        self.assertUsesIndexes(
+            RestaurantMenuItem.objects
+            .filter(restaurant_id=1, availability=True)
+            .values_list('product_id', flat=True)
+        )
+
+    def test_category_products(self):
+        self.assertUsesIndexes(
+            Product.objects
+            .filter(category_id=1, id__gt=1)
+            .order_by('id')
+        )
+
+    def test_places_coordinates(self):
+        self.assertUsesIndexes(
+            PlaceCoordinates.objects
+            .filter(normalized_address__in=['москва'])
+        )
+
+    def test_geocoding_queue(self):
+        self.assertUsesIndexes(
+            GeocodingJob.objects
+            .available()
+            .order_by('created_at')
+        )
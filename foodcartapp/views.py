@@ -1,70 +1,262 @@
+import re
+from decimal import Decimal
+from operator import itemgetter
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
-from django.templatetags.static import static
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import IntegerField, ModelSerializer
+
+from coordinates.coords_handlers import enqueue_geocoding_many
+from .banners import get_banners_content
+from .candidates import refresh_order_candidates
+from .catalog import (
+    get_cached_catalog_content,
+    get_catalog_etag,
+    get_catalog_last_modified,
+)
+from .idempotency import idempotent
+from .models import MAX_ID, Order, Product, ProductInOrder, RestaurantMenuItem
+from .serialization import dump_api_json
+
 
-from coordinates.coords_handlers import save_coordinates
-from .models import Order, Product, ProductInOrder
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
 
 def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
-        {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
-        }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    banners_content = get_banners_content()
+    if ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(banners_content['gzip'], content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(banners_content['identity'], content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def dump_product_category(product):
+    if not product['category_id']:
+        return None
+    return {
+        'id': product['category_id'],
+        'name': product['category__name'],
+    }
+
+
+def dump_product_image(product):
+    image_storage = Product._meta.get_field('image').storage
+    return image_storage.url(product['image'])
+
+
+def dump_product_restaurant(product):
+    return {
+        'id': product['id'],
+        'name': product['name'],
+    }
+
+
+PRODUCT_FIELDS = {
+    'id': (['id'], itemgetter('id')),
+    'name': (['name'], itemgetter('name')),
+    'price': (['price'], lambda product: str(product['price'])),
+    'special_status': (['special_status'], itemgetter('special_status')),
+    'description': (['description'], itemgetter('description')),
+    'category': (['category_id', 'category__name'], dump_product_category),
+    'image': (['image'], dump_product_image),
+    'restaurant': (['id', 'name'], dump_product_restaurant),
+}
+
+PRODUCTS_PAGE_MAX_SIZE = 500
+
+
+def encode_products_cursor(product_id):
+    return urlsafe_base64_encode(str(product_id).encode())
+
+
+def decode_products_cursor(cursor):
+    try:
+        return int(urlsafe_base64_decode(cursor))
+    except ValueError:
+        raise ValueError('Некорректный cursor')
 
 
+def parse_products_query(query_params):
+    products_query = {
+        'fields': list(PRODUCT_FIELDS),
+        'category_id': None,
+        'special_status': None,
+        'after_id': None,
+        'limit': None,
+    }
+
+    if query_params.get('fields'):
+        fields = query_params['fields'].split(',')
+        unknown_fields = set(fields) - set(PRODUCT_FIELDS)
+        if unknown_fields:
+            raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown_fields))}')
+        products_query['fields'] = list(dict.fromkeys(fields))
+
+    if query_params.get('category'):
+        try:
+            products_query['category_id'] = int(query_params['category'])
+        except ValueError:
+            raise ValueError('category должен быть числом')
+
+    if query_params.get('special_status'):
+        special_status = query_params['special_status'].lower()
+        if special_status not in ('true', 'false', '1', '0'):
+            raise ValueError('special_status должен быть true или false')
+        products_query['special_status'] = special_status in ('true', '1')
+
+    if query_params.get('cursor'):
+        products_query['after_id'] = decode_products_cursor(query_params['cursor'])
+
+    if query_params.get('limit') or query_params.get('cursor'):
+        try:
+            limit = int(query_params.get('limit', PRODUCTS_PAGE_MAX_SIZE))
+        except ValueError:
+            raise ValueError('limit должен быть числом')
+        if limit < 1:
+            raise ValueError('limit должен быть больше нуля')
+        products_query['limit'] = min(limit, PRODUCTS_PAGE_MAX_SIZE)
+
+    return products_query
+
+
+def encode_products_query(products_query):
+    query_params = {}
+    if products_query['fields'] != list(PRODUCT_FIELDS):
+        query_params['fields'] = ','.join(products_query['fields'])
+    if products_query['category_id'] is not None:
+        query_params['category'] = products_query['category_id']
+    if products_query['special_status'] is not None:
+        query_params['special_status'] = str(products_query['special_status']).lower()
+    if products_query['limit'] is not None:
+        query_params['limit'] = products_query['limit']
+    if products_query['after_id'] is not None:
+        query_params['cursor'] = encode_products_cursor(products_query['after_id'])
+    return query_params
+
+
+def serialize_products(fields, category_id, special_status, after_id, limit):
+    columns = ['id']
+    for field in fields:
+        columns.extend(PRODUCT_FIELDS[field][0])
+    products = Product.objects.available().order_by('id')
+
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    if special_status is not None:
+        products = products.filter(special_status=special_status)
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    if limit is not None:
+        products = products[:limit + 1]
+
+    products = list(products.values(*dict.fromkeys(columns)))
+    has_next_page = limit is not None and len(products) > limit
+    if has_next_page:
+        products = products[:limit]
+
+    fields_dumpers = [(field, PRODUCT_FIELDS[field][1]) for field in fields]
+    dumped_products = [
+        {field: dump_field(product) for field, dump_field in fields_dumpers}
+        for product in products
+    ]
+    next_after_id = products[-1]['id'] if has_next_page else None
+    return dumped_products, next_after_id
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=get_catalog_etag, last_modified_func=get_catalog_last_modified)
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
+    try:
+        products_query = parse_products_query(request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400, json_dumps_params={
+            'ensure_ascii': False,
+        })
+
+    def build_content():
+        dumped_products, next_after_id = serialize_products(**products_query)
+        if products_query['limit'] is None:
+            return dump_api_json(dumped_products)
+
+        next_page_url = None
+        if next_after_id is not None:
+            next_page_params = {
+                **encode_products_query(products_query),
+                'cursor': encode_products_cursor(next_after_id),
             }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+            next_page_url = f'{request.path}?{urlencode(next_page_params)}'
+        return dump_api_json({
+            'results': dumped_products,
+            'next': next_page_url,
+        })
+
+    # The key is built from the parsed query, so unknown parameters
+    # and different spellings of the same query share one cached body.
+    query_string = urlencode(encode_products_query(products_query))
+    content = get_cached_catalog_content(request, f'products?{query_string}', build_content)
+    return HttpResponse(content, content_type='application/json')
+
+
+def get_products_by_id(products_ids):
+    return (
+        Product.objects
+        .annotate(is_available=Exists(
+            RestaurantMenuItem.objects.filter(product=OuterRef('pk'), availability=True)
+        ))
+        .in_bulk(set(products_ids))
+    )
+
+
+# Larger quantities would overflow the column in the database instead
+# of failing validation.
+MAX_PRODUCT_QUANTITY = 2 ** 15 - 1
+# The largest total the Order.total_price column can store.
+MAX_ORDER_TOTAL_PRICE = Decimal('99999999.99')
 
 
 class ProductSerializer(ModelSerializer):
+    product = IntegerField(min_value=1, max_value=MAX_ID)
+
     class Meta:
         model = ProductInOrder
         fields = ['product', 'quantity']
+        extra_kwargs = {
+            'quantity': {'max_value': MAX_PRODUCT_QUANTITY},
+        }
+
+
+def collect_products_ids(orders_data):
+    # Ids are coerced the way ProductSerializer does it, so "16" is
+    # prefetched together with 16.
+    product_field = ProductSerializer().fields['product']
+    products_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict):
+            continue
+        products = order_data.get('products')
+        if not isinstance(products, list):
+            continue
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            try:
+                products_ids.add(product_field.run_validation(product.get('product')))
+            except ValidationError:
+                continue
+    return products_ids
 
 
 class ApplicationSerializer(ModelSerializer):
@@ -74,35 +266,120 @@ class ApplicationSerializer(ModelSerializer):
         model = Order
         fields = ['firstname', 'lastname', 'phonenumber', 'address', 'products']
 
+    def validate_products(self, products):
+        products_ids = [product['product'] for product in products]
+        products_by_id = self.context.get('products_by_id')
+        if products_by_id is None:
+            products_by_id = get_products_by_id(products_ids)
 
-@api_view(['POST'])
-@transaction.atomic
-def register_order(request):
-    serializer = ApplicationSerializer(data=request.data)
-    serializer.is_valid(raise_exception=True)
+        errors = []
+        for product_id in products_ids:
+            product = products_by_id.get(product_id)
+            if not product:
+                errors.append(f'Товар с id {product_id} не найден')
+            elif not product.is_available:
+                errors.append(f'Товара «{product.name}» нет в продаже')
+        if errors:
+            raise ValidationError(errors)
 
-    if not serializer.is_valid():
-        return Response(serializer.errors)
+        products = [
+            {**product, 'product': products_by_id[product['product']]}
+            for product in products
+        ]
+        total_price = sum(
+            product['product'].price * product['quantity'] for product in products
+        )
+        if total_price > MAX_ORDER_TOTAL_PRICE:
+            raise ValidationError(
+                f'Сумма заказа не может быть больше {MAX_ORDER_TOTAL_PRICE} руб.'
+            )
+        return products
 
-    order_address = serializer.validated_data['address']
 
-    new_order = Order.objects.create(
-        firstname=serializer.validated_data['firstname'],
-        lastname=serializer.validated_data['lastname'],
-        phonenumber=serializer.validated_data['phonenumber'],
-        address=order_address,
-    )
-    save_coordinates(order_address)
+def create_orders(orders_data):
+    orders = Order.objects.bulk_create([
+        Order(
+            firstname=order_data['firstname'],
+            lastname=order_data['lastname'],
+            phonenumber=order_data['phonenumber'],
+            address=order_data['address'],
+            total_price=sum(
+                product['product'].price * product['quantity']
+                for product in order_data['products']
+            ),
+        ) for order_data in orders_data
+    ])
 
     products = [
         ProductInOrder(
             product=product['product'],
-            order=new_order,
+            order=order,
             quantity=product['quantity'],
             order_price=product['product'].price
-        ) for product in serializer.validated_data['products']
+        )
+        for order, order_data in zip(orders, orders_data)
+        for product in order_data['products']
     ]
     ProductInOrder.objects.bulk_create(products)
+
+    enqueue_geocoding_many(order.address for order in orders)
+    refresh_order_candidates(order.id for order in orders)
+    return orders
+
+
+@api_view(['POST'])
+@idempotent
+@transaction.atomic
+def register_order(request):
+    serializer = ApplicationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    create_orders([serializer.validated_data])
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+@idempotent
+@transaction.atomic
+def register_orders_batch(request):
+    if not isinstance(request.data, list):
+        raise ValidationError({'non_field_errors': ['Ожидается список заказов']})
+    if len(request.data) > settings.ORDERS_BATCH_MAX_SIZE:
+        raise ValidationError({'non_field_errors': [
+            f'В пакете не может быть больше {settings.ORDERS_BATCH_MAX_SIZE} заказов'
+        ]})
+
+    products_by_id = get_products_by_id(collect_products_ids(request.data))
+
+    results = []
+    valid_serializers = []
+    for order_index, order_data in enumerate(request.data):
+        serializer = ApplicationSerializer(
+            data=order_data,
+            context={'products_by_id': products_by_id},
+        )
+        if serializer.is_valid():
+            valid_serializers.append((order_index, serializer))
+        else:
+            results.append({
+                'index': order_index,
+                'status': 'invalid',
+                'errors': serializer.errors,
+            })
+
+    orders = create_orders(
+        [serializer.validated_data for order_index, serializer in valid_serializers]
+    )
+    for (order_index, serializer), order in zip(valid_serializers, orders):
+        results.append({
+            'index': order_index,
+            'status': 'created',
+            'id': order.id,
+        })
+
+    results.sort(key=lambda result: result['index'])
+    return Response({
+        'created': len(orders),
+        'invalid': len(results) - len(orders),
+        'results': results,
+    })
@@ -1,3 +1,150 @@
-from django.test import TestCase
+import re
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from foodcartapp.catalog import CATALOG_VERSION_NAME
+from foodcartapp.eligibility import eligibility_index
+from foodcartapp.models import (
+    CacheVersion,
+    Order,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+ORDER_ID_RE = re.compile(r'<tr>\s*<td>(\d+)</td>')
+
+
+class MenuAvailabilityApiTest(TestCase):
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Ресторан')
+        self.category = ProductCategory.objects.create(name='Бургеры')
+        self.products = Product.objects.bulk_create([
+            Product(
+                name=f'Бургер {number}',
+                price=100,
+                image='burger.png',
+                category=self.category,
+            )
+            for number in range(2)
+        ])
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=self.restaurant, product=product, availability=True)
+            for product in self.products
+        ])
+        eligibility_index.invalidate()
+        self.manager = User.objects.create_user('manager', password='password', is_staff=True)
+
+    def update_menu_availability(self, changes):
+        return self.client.post(
+            reverse('restaurateur:update_menu_availability'),
+            {'changes': changes},
+            content_type='application/json',
+        )
+
+    def get_category_change(self):
+        return {
+            'restaurant': self.restaurant.id,
+            'category': self.category.id,
+            'availability': False,
+        }
+
+    def test_anonymous_user_is_forbidden(self):
+        response = self.update_menu_availability([self.get_category_change()])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(RestaurantMenuItem.objects.filter(availability=False).exists())
+
+    def test_unknown_ids_are_rejected(self):
+        self.client.force_login(self.manager)
+        for change in [
+            {'restaurant': 10 ** 6, 'products': [self.products[0].id]},
+            {'restaurant': self.restaurant.id, 'products': [10 ** 6]},
+            {'restaurant': self.restaurant.id, 'category': 10 ** 6},
+            {'restaurant': 10 ** 30, 'products': [self.products[0].id]},
+        ]:
+            response = self.update_menu_availability([{**change, 'availability': False}])
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(RestaurantMenuItem.objects.filter(availability=False).exists())
+
+    def test_category_switch_invalidates_caches_once(self):
+        self.client.force_login(self.manager)
+        catalog_version = CacheVersion.objects.get_version(CATALOG_VERSION_NAME).version
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.update_menu_availability([self.get_category_change()])
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            CacheVersion.objects.get_version(CATALOG_VERSION_NAME).version,
+            catalog_version + 1,
+        )
+        eligibility_index.ensure_fresh()
+        self.assertEqual(
+            eligibility_index.get_restaurants_ids([product.id for product in self.products]),
+            [],
+        )
+
+
+@override_settings(MANAGER_ORDERS_PAGE_SIZE=2)
+class OrdersPaginationTest(TestCase):
+
+    def setUp(self):
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+        orders = Order.objects.bulk_create([
+            Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                address=f'Москва, Арбат, {number}',
+            )
+            for number in range(5)
+        ])
+        # Orders registered at the same moment are told apart by id.
+        registered_at = timezone.now()
+        Order.objects.filter(id__in=[order.id for order in orders[:3]]).update(
+            registered_at=registered_at,
+        )
+        Order.objects.filter(id__in=[order.id for order in orders[3:]]).update(
+            registered_at=registered_at + timedelta(minutes=1),
+        )
+        self.orders_ids = [order.id for order in orders]
+
+    def get_orders_ids(self, response):
+        content = b''.join(response) if response.streaming else response.content
+        return [int(order_id) for order_id in ORDER_ID_RE.findall(content.decode())]
+
+    def test_pages_follow_cursor(self):
+        pages_orders_ids = []
+        page_url = reverse('restaurateur:view_orders')
+        while page_url:
+            response = self.client.get(page_url)
+            self.assertEqual(response.status_code, 200)
+            pages_orders_ids.append(self.get_orders_ids(response))
+            page_url = response.context['next_page_url']
+
+        self.assertEqual(pages_orders_ids[:2], [self.orders_ids[:2], self.orders_ids[2:4]])
+        self.assertEqual(sum(pages_orders_ids, []), self.orders_ids)
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in [
+            'zzz',
+            urlsafe_base64_encode(b'\xff\xfe'),
+            urlsafe_base64_encode(f'{timezone.now().isoformat()}'.encode()),
+            urlsafe_base64_encode(f'{timezone.now().isoformat()}|1|2'.encode()),
+        ]:
+            response = self.client.get(reverse('restaurateur:view_orders'), {'after': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_stream_shows_same_orders(self):
+        response = self.client.get(reverse('restaurateur:view_orders'), {'stream': 1})
+        self.assertTrue(response.streaming)
+        self.assertEqual(self.get_orders_ids(response), self.orders_ids)
@@ -12,6 +12,8 @@ urlpatterns = [
 
     path('restaurants/', views.view_restaurants, name="RestaurantView"),
 
+    path('menu/availability/', views.update_menu_availability, name="update_menu_availability"),
+
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
 
@@ -1,14 +1,42 @@
+from datetime import datetime
+
 from django import forms
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.safestring import mark_safe
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.serializers import (
+    BooleanField,
+    IntegerField,
+    ListField,
+    Serializer,
+)
 
 
-from foodcartapp.models import Product, Restaurant, Order, RestaurantMenuItem
+from foodcartapp.eligibility import eligibility_index
+from foodcartapp.menu import set_menu_availability
+from foodcartapp.models import (
+    MAX_ID,
+    Product,
+    ProductCategory,
+    Restaurant,
+    Order,
+    RestaurantMenuItem,
+)
 
 
 class Login(forms.Form):
@@ -65,18 +93,22 @@ def is_manager(user):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    restaurants = list(Restaurant.objects.order_by('name').only('id', 'name'))
+    products = Product.objects.select_related('category')
+    products_masks, restaurants_positions = eligibility_index.get_products_masks()
 
-    default_availability = {restaurant.id: False for restaurant in restaurants}
+    # Restaurants without available products have no position in the index.
+    restaurants_bits = [
+        1 << restaurants_positions[restaurant.id]
+        if restaurant.id in restaurants_positions else 0
+        for restaurant in restaurants
+    ]
     products_with_restaurants = []
     for product in products:
-
-        availability = {
-            **default_availability,
-            **{item.restaurant_id: item.availability for item in product.menu_items.all()},
-        }
-        orderer_availability = [availability[restaurant.id] for restaurant in restaurants]
+        product_mask = products_masks.get(product.id, 0)
+        orderer_availability = [
+            bool(product_mask & restaurant_bit) for restaurant_bit in restaurants_bits
+        ]
 
         products_with_restaurants.append(
             (product, orderer_availability)
@@ -88,6 +120,63 @@ def view_products(request):
     })
 
 
+class MenuAvailabilityChangeSerializer(Serializer):
+    restaurant = IntegerField(min_value=1, max_value=MAX_ID)
+    products = ListField(
+        child=IntegerField(min_value=1, max_value=MAX_ID),
+        allow_empty=False,
+        required=False,
+    )
+    category = IntegerField(min_value=1, max_value=MAX_ID, required=False)
+    availability = BooleanField()
+
+    def validate(self, change):
+        if ('products' in change) == ('category' in change):
+            raise ValidationError('Укажите либо products, либо category')
+        return change
+
+
+class MenuAvailabilitySerializer(Serializer):
+    changes = MenuAvailabilityChangeSerializer(many=True, allow_empty=False)
+
+    def validate_changes(self, changes):
+        restaurants_ids = {change['restaurant'] for change in changes}
+        products_ids = {
+            product_id
+            for change in changes
+            for product_id in change.get('products', [])
+        }
+        categories_ids = {change['category'] for change in changes if 'category' in change}
+
+        errors = []
+        found_restaurants_ids = set(
+            Restaurant.objects.filter(id__in=restaurants_ids).values_list('id', flat=True)
+        )
+        for restaurant_id in sorted(restaurants_ids - found_restaurants_ids):
+            errors.append(f'Ресторан с id {restaurant_id} не найден')
+        found_products_ids = set(
+            Product.objects.filter(id__in=products_ids).values_list('id', flat=True)
+        )
+        for product_id in sorted(products_ids - found_products_ids):
+            errors.append(f'Товар с id {product_id} не найден')
+        found_categories_ids = set(
+            ProductCategory.objects.filter(id__in=categories_ids).values_list('id', flat=True)
+        )
+        for category_id in sorted(categories_ids - found_categories_ids):
+            errors.append(f'Категория с id {category_id} не найдена')
+        if errors:
+            raise ValidationError(errors)
+        return changes
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def update_menu_availability(request):
+    serializer = MenuAvailabilitySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return Response(set_menu_availability(serializer.validated_data['changes']))
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
@@ -95,18 +184,88 @@ def view_restaurants(request):
     })
 
 
+def encode_orders_cursor(order):
+    cursor = f'{order.registered_at.isoformat()}|{order.id}'
+    return urlsafe_base64_encode(cursor.encode())
+
+
+def decode_orders_cursor(cursor):
+    registered_at, order_id = force_str(urlsafe_base64_decode(cursor)).split('|')
+    return datetime.fromisoformat(registered_at), int(order_id)
+
+
+def get_orders_page(after=None):
+    orders = Order.objects.get_unprocessed()\
+        .only(
+        'id',
+        'status',
+        'payment_method',
+        'firstname',
+        'lastname',
+        'phonenumber',
+        'address',
+        'comment',
+        'total_price',
+        'registered_at',
+    ).order_by('registered_at', 'id')\
+        .get_candidate_restaurants()
+
+    if after:
+        registered_at, order_id = after
+        orders = orders.filter(
+            Q(registered_at__gt=registered_at)
+            | Q(registered_at=registered_at, id__gt=order_id)
+        )
+    return orders[:settings.MANAGER_ORDERS_PAGE_SIZE]
+
+
+def stream_orders(request, context):
+    rows_placeholder = mark_safe('<!-- order rows -->')
+    page = render_to_string('order_items.html', request=request, context={
+        **context,
+        'rows_placeholder': rows_placeholder,
+    })
+    page_head, page_tail = page.split(rows_placeholder)
+    yield page_head
+
+    after = None
+    while True:
+        orders = get_orders_page(after)
+        if not orders:
+            break
+        yield render_to_string('order_rows.html', request=request, context={
+            'orders': orders,
+            'request': request,
+        })
+        if len(orders) < settings.MANAGER_ORDERS_PAGE_SIZE:
+            break
+        last_order = orders[len(orders) - 1]
+        after = (last_order.registered_at, last_order.id)
+
+    yield page_tail
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = Order.objects.get_total_price()\
-        .get_unprocessed()\
-        .get_restaurants()\
-        .defer(
-        'registered_at',
-        'called_at',
-        'delivered_at'
-    ).get_distances()
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(stream_orders(request, {'request': request}))
+
+    after = None
+    if request.GET.get('after'):
+        try:
+            after = decode_orders_cursor(request.GET['after'])
+        except ValueError:
+            return HttpResponseBadRequest('Некорректный параметр after')
+
+    orders = get_orders_page(after)
+    next_page_url = None
+    if len(orders) == settings.MANAGER_ORDERS_PAGE_SIZE:
+        next_page_params = request.GET.copy()
+        next_page_params['after'] = encode_orders_cursor(orders[len(orders) - 1])
+        next_page_url = f'{request.path}?{next_page_params.urlencode()}'
 
     return render(request, template_name='order_items.html', context={
         'orders': orders,
+        'next_page_url': next_page_url,
         'request': request
     })
@@ -0,0 +1,250 @@
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+logger = logging.getLogger('star_burger.metrics')
+
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped_labels = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped_labels) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            self._values[label_values] += amount
+        self.registry.maybe_flush()
+
+    def dump_samples(self):
+        return [[list(label_values), value] for label_values, value in self._values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label values: a count for every bucket and +Inf, then sum.
+        self._values = {}
+
+    def observe(self, value, **labels):
+        label_values = tuple(str(labels[name]) for name in self.labelnames)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            values = self._values.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            values[bucket_index] += 1
+            values[-1] += value
+        self.registry.maybe_flush()
+
+    def dump_samples(self):
+        return [[list(label_values), list(values)] for label_values, values in self._values.items()]
+
+
+class MetricsRegistry:
+    # Every process keeps its metrics in memory. With METRICS_DIR set each
+    # process also dumps them to its own file in that directory at most every
+    # METRICS_FLUSH_INTERVAL seconds, and the /metrics view sums the files,
+    # so that a scrape hitting any gunicorn worker sees all of them.
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Serializes writes of the process file, the threads share its name.
+        self._flush_lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._flushed_at = 0
+
+    def _register(self, metric_class, name, documentation, labelnames, **kwargs):
+        with self.lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(
+                    self, name, documentation, labelnames, **kwargs
+                )
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collect):
+        # collect() returns current totals of the process as a list of
+        # (counter name, documentation, labels dict, value).
+        with self.lock:
+            self._collectors.append(collect)
+
+    def dump(self):
+        collected_samples = [
+            sample for collect in self._collectors for sample in collect()
+        ]
+        with self.lock:
+            metrics_dump = {
+                metric.name: {
+                    'type': metric.type,
+                    'documentation': metric.documentation,
+                    'labelnames': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', [])),
+                    'samples': metric.dump_samples(),
+                }
+                for metric in self._metrics.values()
+            }
+        for name, documentation, labels, value in collected_samples:
+            metric_dump = metrics_dump.setdefault(name, {
+                'type': Counter.type,
+                'documentation': documentation,
+                'labelnames': list(labels),
+                'buckets': [],
+                'samples': [],
+            })
+            metric_dump['samples'].append([list(labels.values()), value])
+        return metrics_dump
+
+    def _get_process_file_path(self):
+        return os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+
+    def _is_flush_due(self):
+        return time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    def _write_process_file(self):
+        self._flushed_at = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        file_path = self._get_process_file_path()
+        temporary_file_path = f'{file_path}.tmp'
+        with open(temporary_file_path, 'w') as metrics_file:
+            json.dump(self.dump(), metrics_file)
+        os.replace(temporary_file_path, file_path)
+
+    def flush(self):
+        if not settings.METRICS_DIR:
+            return
+        with self._flush_lock:
+            self._write_process_file()
+
+    def maybe_flush(self):
+        # Called on every inc() and observe(), so a thread already writing
+        # the file is not waited for and a failed write never reaches
+        # the code being measured.
+        if not settings.METRICS_DIR or not self._is_flush_due():
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            if self._is_flush_due():
+                self._write_process_file()
+        except OSError:
+            logger.exception('Could not write metrics to %s', settings.METRICS_DIR)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        if not settings.METRICS_DIR:
+            return self.dump()
+
+        self.flush()
+        processes_dumps = []
+        for file_name in os.listdir(settings.METRICS_DIR):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, file_name)) as metrics_file:
+                    processes_dumps.append(json.load(metrics_file))
+            except (OSError, ValueError):
+                continue
+        return merge_dumps(processes_dumps)
+
+
+def merge_dumps(metrics_dumps):
+    merged_dump = {}
+    for metrics_dump in metrics_dumps:
+        for name, metric_dump in metrics_dump.items():
+            merged_metric = merged_dump.setdefault(name, {
+                **metric_dump,
+                'samples': {},
+            })
+            for label_values, value in metric_dump['samples']:
+                label_values = tuple(label_values)
+                if metric_dump['type'] == Histogram.type:
+                    merged_values = merged_metric['samples'].setdefault(
+                        label_values, [0] * len(value)
+                    )
+                    for index, bucket_value in enumerate(value):
+                        merged_values[index] += bucket_value
+                else:
+                    merged_metric['samples'][label_values] = (
+                        merged_metric['samples'].get(label_values, 0) + value
+                    )
+    for metric_dump in merged_dump.values():
+        metric_dump['samples'] = [
+            [list(label_values), value]
+            for label_values, value in metric_dump['samples'].items()
+        ]
+    return merged_dump
+
+
+def render_text(metrics_dump):
+    lines = []
+    for name, metric_dump in sorted(metrics_dump.items()):
+        lines.append(f'# HELP {name} {metric_dump["documentation"]}')
+        lines.append(f'# TYPE {name} {metric_dump["type"]}')
+        for label_values, value in metric_dump['samples']:
+            labels = list(zip(metric_dump['labelnames'], label_values))
+            if metric_dump['type'] != Histogram.type:
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                continue
+
+            *buckets_counts, values_sum = value
+            cumulative_count = 0
+            for bucket, bucket_count in zip(
+                [*metric_dump['buckets'], math.inf], buckets_counts,
+            ):
+                cumulative_count += bucket_count
+                bucket_labels = format_labels([*labels, ('le', format_value(bucket))])
+                lines.append(f'{name}_bucket{bucket_labels} {format_value(cumulative_count)}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(values_sum)}')
+            lines.append(f'{name}_count{format_labels(labels)} {format_value(cumulative_count)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
@@ -0,0 +1,149 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import registry
+
+
+logger = logging.getLogger('star_burger.query_budget')
+
+REQUESTS_TOTAL = registry.counter(
+    'starburger_http_requests_total',
+    'Запросы к сайту',
+    ['view', 'method', 'status'],
+)
+REQUEST_DURATION = registry.histogram(
+    'starburger_http_request_duration_seconds',
+    'Время ответа на запрос',
+    ['view', 'method'],
+)
+DB_QUERIES_TOTAL = registry.counter(
+    'starburger_db_queries_total',
+    'Запросы к базе данных',
+    ['view'],
+)
+DB_DURATION = registry.histogram(
+    'starburger_db_duration_seconds',
+    'Время работы с базой данных за один запрос к сайту',
+    ['view'],
+)
+
+
+def get_view_name(request):
+    if request.resolver_match:
+        return request.resolver_match.view_name
+    return None
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started_at
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    # Counts queries and database time of every request and compares the
+    # count with the budget of the view, see QUERY_BUDGETS in settings.
+    # When QUERY_BUDGET_ENABLED is off Django drops the middleware at start.
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = QueryStats()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(query_stats):
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self.stream_content(
+                response.streaming_content, request, response, query_stats, started_at,
+            )
+        else:
+            self.check_budget(request, response, query_stats, started_at)
+        return response
+
+    def stream_content(self, content, request, response, query_stats, started_at):
+        with connection.execute_wrapper(query_stats):
+            yield from content
+        self.check_budget(request, response, query_stats, started_at)
+
+    def check_budget(self, request, response, query_stats, started_at):
+        view_name = get_view_name(request)
+        budget = settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+        is_exceeded = budget is not None and query_stats.count > budget
+
+        log_level = logging.WARNING if is_exceeded else logging.DEBUG
+        if logger.isEnabledFor(log_level):
+            logger.log(log_level, json.dumps({
+                'event': 'query_budget_exceeded' if is_exceeded else 'queries',
+                'view': view_name,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': query_stats.count,
+                'budget': budget,
+                'db_ms': round(query_stats.duration * 1000, 2),
+                'total_ms': round((time.perf_counter() - started_at) * 1000, 2),
+            }, ensure_ascii=False))
+
+        if is_exceeded and settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(
+                f'{view_name}: {query_stats.count} запросов к базе при бюджете {budget}'
+            )
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = QueryStats()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(query_stats):
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self.stream_content(
+                response.streaming_content, request, response, query_stats, started_at,
+            )
+        else:
+            self.observe(request, response, query_stats, started_at)
+        return response
+
+    def stream_content(self, content, request, response, query_stats, started_at):
+        with connection.execute_wrapper(query_stats):
+            yield from content
+        self.observe(request, response, query_stats, started_at)
+
+    def observe(self, request, response, query_stats, started_at):
+        # Unresolved paths share one label to keep the number of series bounded.
+        view_name = get_view_name(request) or 'unresolved'
+        REQUESTS_TOTAL.inc(view=view_name, method=request.method, status=response.status_code)
+        REQUEST_DURATION.observe(
+            time.perf_counter() - started_at,
+            view=view_name,
+            method=request.method,
+        )
+        DB_QUERIES_TOTAL.inc(query_stats.count, view=view_name)
+        DB_DURATION.observe(query_stats.duration, view=view_name)
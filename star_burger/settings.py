@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 import dj_database_url
 from environs import Env
@@ -26,23 +27,27 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'phonenumber_field',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'star_burger.middleware.MetricsMiddleware',
+    'star_burger.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'rollbar.contrib.django.middleware.RollbarNotifierMiddlewareExcluding404',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROLLBAR = {
     'access_token': env.str('ROLLBAR_TOKEN', ''),
     'environment': env.str('ROLLBAR_ENV_NAME', 'development'),
@@ -89,6 +94,13 @@ WSGI_APPLICATION = 'star_burger.wsgi.application'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+CACHES = {
+    'default': {
+        'BACKEND': env.str('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env.str('CACHE_LOCATION', ''),
+    }
+}
+
 DATABASES = {
     'default': dj_database_url.config(default=env.str('DB_URL')),
 }
@@ -131,3 +143,64 @@ STATICFILES_DIRS = [
 ]
 
 YANDEX_API_KEY = env.str('YANDEX_API_KEY')
+
+GEOCODER = env.str('GEOCODER', 'coordinates.geocoder.YandexGeocoder')
+GEOCODER_URL = env.str('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_MAX_RETRIES = env.int('GEOCODER_MAX_RETRIES', 2)
+GEOCODER_FAILURE_THRESHOLD = env.int('GEOCODER_FAILURE_THRESHOLD', 5)
+GEOCODER_RESET_TIMEOUT = env.float('GEOCODER_RESET_TIMEOUT', 30)
+GEOCODER_MAX_CONCURRENCY = env.int('GEOCODER_MAX_CONCURRENCY', 4)
+GEOCODING_MAX_ATTEMPTS = env.int('GEOCODING_MAX_ATTEMPTS', 5)
+GEOCODING_FAILED_RETRY_DELAY = timedelta(hours=env.int('GEOCODING_FAILED_RETRY_HOURS', 24))
+GEOCODING_JOB_LEASE = timedelta(seconds=env.int('GEOCODING_JOB_LEASE_SECONDS', 600))
+GEOCODE_TTL = timedelta(days=env.int('GEOCODE_TTL_DAYS', 90))
+GEOCODE_NEGATIVE_TTL = timedelta(hours=env.int('GEOCODE_NEGATIVE_TTL_HOURS', 24))
+COORDINATES_CACHE_TIMEOUT = env.int('COORDINATES_CACHE_TIMEOUT', 24 * 60 * 60)
+COORDINATES_LOCAL_CACHE_SIZE = env.int('COORDINATES_LOCAL_CACHE_SIZE', 10000)
+COORDINATES_LOCAL_CACHE_TIMEOUT = env.int('COORDINATES_LOCAL_CACHE_TIMEOUT', 60)
+
+MANAGER_ORDERS_PAGE_SIZE = env.int('MANAGER_ORDERS_PAGE_SIZE', 50)
+ORDER_RESTAURANTS_LIMIT = env.int('ORDER_RESTAURANTS_LIMIT', 5)
+ORDER_RESTAURANTS_RADIUS_KM = env.float('ORDER_RESTAURANTS_RADIUS_KM', None)
+
+API_JSON_DUMPS = env.str('API_JSON_DUMPS', 'foodcartapp.serialization.dumps_json')
+
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 500)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=env.int('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+QUERY_BUDGET_ENABLED = env.bool('QUERY_BUDGET_ENABLED', False)
+QUERY_BUDGET_RAISE = env.bool('QUERY_BUDGET_RAISE', False)
+QUERY_BUDGET_DEFAULT = env.int('QUERY_BUDGET_DEFAULT', 50)
+QUERY_BUDGETS = env.dict('QUERY_BUDGETS', {
+    'restaurateur:view_orders': 6,
+    'restaurateur:ProductsView': 6,
+    'restaurateur:update_menu_availability': 15,
+    'foodcartapp:product_list_api': 3,
+    'foodcartapp:banners_list_api': 3,
+    'foodcartapp:register_order': 20,
+    'foodcartapp:register_orders_batch': 30,
+}, subcast_values=int)
+
+METRICS_ENABLED = env.bool('METRICS_ENABLED', False)
+METRICS_TOKEN = env.str('METRICS_TOKEN', '')
+METRICS_DIR = env.str('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', 1)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'star_burger.query_budget': {
+            'handlers': ['console'],
+            'level': env.str('QUERY_BUDGET_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .metrics import MetricsRegistry
+from .middleware import QueryBudgetExceeded
+
+
+class MetricsRegistryTest(SimpleTestCase):
+
+    def test_threads_flush_process_file_together(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', 'Тестовый счётчик')
+        errors = []
+
+        def increment():
+            try:
+                for _ in range(200):
+                    counter.inc()
+            except Exception as error:
+                errors.append(error)
+
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(METRICS_DIR=metrics_dir, METRICS_FLUSH_INTERVAL=0):
+                threads = [threading.Thread(target=increment) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                registry.flush()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(metrics_dir), [f'{os.getpid()}.json'])
+            with open(os.path.join(metrics_dir, f'{os.getpid()}.json')) as metrics_file:
+                samples = json.load(metrics_file)['test_total']['samples']
+        self.assertEqual(samples, [[[], 1600]])
+
+    def test_failed_flush_does_not_break_counting(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', 'Тестовый счётчик')
+
+        with tempfile.NamedTemporaryFile() as not_a_dir:
+            with override_settings(METRICS_DIR=not_a_dir.name, METRICS_FLUSH_INTERVAL=0):
+                with self.assertLogs('star_burger.metrics', 'ERROR'):
+                    counter.inc()
+        self.assertEqual(registry.dump()['test_total']['samples'], [[[], 1]])
+
+
+@override_settings(
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGETS={'foodcartapp:product_list_api': 0},
+    QUERY_BUDGET_DEFAULT=None,
+)
+class QueryBudgetMiddlewareTest(TestCase):
+
+    def setUp(self):
+        # The middleware reads QUERY_BUDGET_ENABLED once, when the handler
+        # loads it, so the client has to load it under the test settings.
+        self.client.handler.load_middleware()
+
+    def test_exceeded_budget_is_logged(self):
+        with self.assertLogs('star_burger.query_budget', 'WARNING') as logs:
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+
+        [record] = logs.records
+        log_entry = json.loads(record.getMessage())
+        self.assertEqual(log_entry['event'], 'query_budget_exceeded')
+        self.assertEqual(log_entry['view'], 'foodcartapp:product_list_api')
+        self.assertEqual(log_entry['budget'], 0)
+        self.assertGreater(log_entry['queries'], 0)
+
+    def test_exceeded_budget_raises(self):
+        with self.settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                with self.assertLogs('star_burger.query_budget', 'WARNING'):
+                    self.client.get('/api/products/')
+
+    def test_streamed_response_is_checked_after_last_row(self):
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+
+        with self.settings(QUERY_BUDGETS={'restaurateur:view_orders': 0}):
+            response = self.client.get('/manager/orders/', {'stream': 1})
+            with self.assertLogs('star_burger.query_budget', 'WARNING') as logs:
+                b''.join(response)
+        log_entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(log_entry['view'], 'restaurateur:view_orders')
@@ -0,0 +1,47 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .metrics import render_text, registry
+
+
+def add_cache_hit_ratio(metrics_dump):
+    cache_requests = defaultdict(dict)
+    cache_requests_dump = metrics_dump.get('starburger_cache_requests_total')
+    if not cache_requests_dump:
+        return
+    for (cache_name, result), requests_count in cache_requests_dump['samples']:
+        cache_requests[cache_name][result] = requests_count
+
+    samples = []
+    for cache_name, results in cache_requests.items():
+        total_requests = sum(results.values())
+        if total_requests:
+            hits = results.get('local_hits', 0) + results.get('shared_hits', 0)
+            samples.append([[cache_name], hits / total_requests])
+    metrics_dump['starburger_cache_hit_ratio'] = {
+        'type': 'gauge',
+        'documentation': 'Доля обращений к кэшу координат и расстояний, нашедших значение',
+        'labelnames': ['cache'],
+        'buckets': [],
+        'samples': samples,
+    }
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''),
+        f'Bearer {settings.METRICS_TOKEN}',
+    ):
+        return HttpResponseForbidden()
+
+    metrics_dump = registry.collect()
+    add_cache_hit_ratio(metrics_dump)
+    return HttpResponse(
+        render_text(metrics_dump),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )